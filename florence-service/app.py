@@ -1,90 +1,96 @@
 import os
 import logging
-import sys
-import threading
-from unittest.mock import MagicMock
-
-# Mock flash_attn to bypass transformers dynamic module import check.
-# Florence-2's modeling file does `import flash_attn` at the top level.
-# We mock it so the import succeeds, but we force SDPA attention below
-# so flash_attn is never actually called at runtime.
-mock_flash = MagicMock()
-mock_flash.__spec__ = MagicMock()
-mock_flash.__version__ = "2.6.3"
-sys.modules["flash_attn"] = mock_flash
-sys.modules["flash_attn.flash_attn_interface"] = MagicMock()
-sys.modules["flash_attn.bert_padding"] = MagicMock()
+import time
 
+import pypdfium2 as pdfium
 from flask import Flask, request, jsonify
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForCausalLM
-import torch
+
+from model_server import (
+    MODEL_ID, CAPTION_PROMPT, OCR_PROMPT, MAX_BATCH_SIZE, BACKEND, MODEL_INPUT_SIZE,
+    TILED_OCR, TILE_MAX_LINE_PX, TILE_COLUMNS,
+    ModelClient, ModelError, ModelUnavailable, start as start_model_server
+)
+from result_cache import ResultCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Optimization for low-resource CPU envs
-torch.set_num_threads(4) 
-
 app = Flask(__name__)
 
-# Global model variables
-model = None
-processor = None
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model_id = 'microsoft/Florence-2-large-ft'
+# The model lives in the model server process (model_server.py); this process
+# only handles HTTP, the result cache and image paths, so it never imports torch.
+model_id = MODEL_ID
+model_client = ModelClient()
+
+# MAX_BATCH_SIZE (FLORENCE_MAX_BATCH_SIZE) bounds the images per model.generate()
+# call. The model server coalesces concurrent /analyze and /analyze_batch jobs from
+# every worker into batches up to that size (FLORENCE_BATCH_WINDOW_MS, see
+# model_server.py); a client "batchSize" only caps how many of its own pages
+# travel together as one job.
+
+SHARED_ENCODING = os.environ.get("FLORENCE_SHARED_ENCODING", "true").lower() in ("1", "true", "yes")
 
-def load_model():
-    global model, processor
-    logger.info(f"Loading model: {model_id}...")
+# Persistent result cache keyed by image SHA-256 + model + tasks (see result_cache.py).
+# Lives on its own volume: the shared processing volume is wiped by monitor_queue.sh --cleanup.
+CACHE_ENABLED = os.environ.get("FLORENCE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_PATH = os.environ.get("FLORENCE_CACHE_PATH", "/app/cache/florence_results.sqlite3")
+CACHE_MAX_MB = int(os.environ.get("FLORENCE_CACHE_MAX_MB", "1024"))
+CACHE_TASKS = [CAPTION_PROMPT, OCR_PROMPT]
+# Reduced-precision backends can word OCR slightly differently, so they get their own
+# cache namespace; fp32 keeps the plain model id so existing entries stay valid
+CACHE_MODEL = model_id if BACKEND == "fp32" else f"{model_id}@{BACKEND}"
+PDF_RENDER_TAG = f"r{MODEL_INPUT_SIZE}" + (f"-t{TILE_COLUMNS}x{TILE_MAX_LINE_PX:g}" if TILED_OCR else "")
+
+result_cache = ResultCache(CACHE_PATH, CACHE_MAX_MB * 1024 * 1024) if CACHE_ENABLED else None
+
+
+def model_status():
+    """Model server status, or None while it is not reachable."""
     try:
-        # Use SDPA (Scaled Dot Product Attention) — built into PyTorch 2.0+
-        # This avoids needing the external flash_attn package while still being fast on A10
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id, 
-            trust_remote_code=True,
-            attn_implementation="sdpa"
-        ).to(device)
-        model.eval() # Explicitly set to eval mode
-        processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
-        logger.info("Model loaded successfully.")
-    except Exception as e:
-        logger.error(f"Failed to load model: {str(e)}")
-        raise e
+        return model_client.status()
+    except (ModelUnavailable, ModelError):
+        return None
+
 
 @app.route('/health', methods=['GET'])
 def health():
-    if model is None:
-        return jsonify({"status": "loading", "message": "Model is loading..."}), 503
-    return jsonify({"status": "ready"}), 200
-
-def run_task(image, task_prompt):
-    """Run a single Florence-2 task and return the parsed result."""
-    with torch.inference_mode():
-        inputs = processor(text=task_prompt, images=image, return_tensors="pt").to(device)
-        generated_ids = model.generate(
-            input_ids=inputs["input_ids"],
-            pixel_values=inputs["pixel_values"],
-            max_new_tokens=1024,
-            do_sample=False,
-            num_beams=1,
-        )
-        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-        parsed = processor.post_process_generation(
-            generated_text,
-            task=task_prompt,
-            image_size=(image.width, image.height)
-        )
-        del inputs, generated_ids, generated_text
-        return parsed
+    cache_stats = result_cache.stats() if result_cache else {"enabled": False}
+    status = model_status()
+    if status is None or status["ready"] == 0:
+        return jsonify({"status": "loading", "message": "Model is loading...", "model": status, "cache": cache_stats}), 503
+    return jsonify({"status": "ready", "model": status, "cache": cache_stats}), 200
+
+
+def cache_key(image_path):
+    return ResultCache.make_key(ResultCache.file_digest(image_path), CACHE_MODEL, CACHE_TASKS)
+
+
+def cache_lookup(image_path, bypass):
+    """Return (key, cached_result). key is None when caching is off for this request."""
+    if result_cache is None or bypass:
+        return None, None
+    key = cache_key(image_path)
+    return key, result_cache.get(key)
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+_device = None
+
+
+def model_device():
+    """Device reported by the model replicas (cuda/cpu), cached once known."""
+    global _device
+    if _device is None:
+        _device = (model_status() or {}).get("device")
+    return _device
 
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    if model is None:
-        return jsonify({"error": "Model not ready"}), 503
-
     data = request.json
     if not data or 'filePath' not in data:
         return jsonify({"error": "Missing 'filePath' in request body"}), 400
@@ -95,25 +101,28 @@ def analyze():
         return jsonify({"error": f"File not found: {image_path}"}), 404
 
     try:
-        image = Image.open(image_path)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        # Task 1: Visual description (for diagram detection & image understanding)
-        caption_prompt = "<MORE_DETAILED_CAPTION>"
-        caption_result = run_task(image, caption_prompt)
-        description = caption_result.get(caption_prompt, "")
-
-        # Task 2: OCR text extraction (replaces Tesseract)
-        ocr_prompt = "<OCR>"
-        ocr_result = run_task(image, ocr_prompt)
-        ocr_text = ocr_result.get(ocr_prompt, "")
-
-        # Cleanup
-        import gc
-        gc.collect()
-        if device == "cuda":
-            torch.cuda.empty_cache()
+        started = time.perf_counter()
+        key, cached = cache_lookup(image_path, data.get('bypassCache', False))
+        if cached is not None:
+            logger.info(f"Cache hit for {image_path}")
+            return jsonify({
+                "description": cached["description"],
+                "ocr_text": cached["ocr_text"],
+                "metadata": {
+                    "model": model_id,
+                    "image_size": cached["image_size"],
+                    "device": model_device(),
+                    "cached": True,
+                    "timings": {"totalMs": _elapsed_ms(started)}
+                }
+            })
+
+        [(results, timings)] = model_client.analyze([[image_path]])
+        result = results[0]
+        description = result["description"]
+        ocr_text = result["ocr_text"]
+        if key is not None:
+            result_cache.put(key, result)
 
         logger.info(f"Analyzed {image_path}: caption={len(description)} chars, ocr={len(ocr_text)} chars")
 
@@ -122,22 +131,216 @@ def analyze():
             "ocr_text": ocr_text,
             "metadata": {
                 "model": model_id,
-                "image_size": image.size,
-                "device": device
+                "image_size": result["image_size"],
+                "device": model_device(),
+                "cached": False,
+                "timings": timings
             }
         })
 
+    except ModelUnavailable as e:
+        return jsonify({"error": f"Model not ready: {e}"}), 503
     except Exception as e:
         logger.error(f"Error analyzing image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-# Start loading model in background when imported by Gunicorn
-if __name__ != '__main__':
-    t = threading.Thread(target=load_model)
-    t.daemon = True
-    t.start()
+def parse_batch_size(data):
+    """Client "batchSize", clamped to [1, MAX_BATCH_SIZE]. Raises ValueError when not an integer."""
+    try:
+        return min(MAX_BATCH_SIZE, max(1, int(data.get('batchSize', MAX_BATCH_SIZE))))
+    except (TypeError, ValueError):
+        raise ValueError("'batchSize' must be an integer")
+
+
+def cached_result(label, cached):
+    return {
+        **label,
+        "description": cached["description"],
+        "ocr_text": cached["ocr_text"],
+        "metadata": {"image_size": cached["image_size"], "cached": True, "tiled_ocr": cached.get("tiled_ocr", False)}
+    }
+
+
+def analyze_pending(sources, labels, keys, pending, batch_size, results):
+    """
+    Run the pending indexes through the model server and fill results in place.
+    Every batch is queued on the model server at once; replicas open or render
+    the pages per batch, so a 200-page document never sits in RAM at once.
+    Returns (encoderMsSaved, longest queue wait in ms).
+    """
+    encoder_ms_saved = 0.0
+    queue_wait_ms = 0.0
+    batches = [pending[offset:offset + batch_size] for offset in range(0, len(pending), batch_size)]
+    analyzed = model_client.analyze([[sources[i] for i in batch] for batch in batches]) if batches else []
+    for batch_indexes, (analyses, timings) in zip(batches, analyzed):
+        encoder_ms_saved += timings["encoderMsSaved"]
+        queue_wait_ms = max(queue_wait_ms, timings["queueWaitMs"])
+        for i, analysis in zip(batch_indexes, analyses):
+            results[i] = {
+                **labels[i],
+                "description": analysis["description"],
+                "ocr_text": analysis["ocr_text"],
+                "metadata": {
+                    "image_size": analysis["image_size"],
+                    "cached": False,
+                    "tiled_ocr": analysis["tiled_ocr"],
+                    "timings": timings
+                }
+            }
+            if keys[i] is not None:
+                result_cache.put(keys[i], analysis)
+    return encoder_ms_saved, queue_wait_ms
+
+
+def batch_metadata(batch_size, analyzed, cache_hits, started, encoder_ms_saved, queue_wait_ms):
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+    return {
+        "model": model_id,
+        "device": model_device(),
+        "batchSize": batch_size,
+        "analyzed": analyzed,
+        "cacheHits": cache_hits,
+        "elapsedMs": elapsed_ms,
+        "perPageMs": round(elapsed_ms / analyzed, 1) if analyzed else 0,
+        "sharedEncoding": SHARED_ENCODING,
+        "encoderMsSaved": round(encoder_ms_saved, 1),
+        # Longest time one of this request's jobs waited for a batch slot
+        "queueWaitMs": queue_wait_ms
+    }
+
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many page images in one request.
+    Body: {"filePaths": ["/tmp/n8n_processing/<prefix>page-1.png", ...], "batchSize": 4, "bypassCache": false}
+    Returns {"results": [...]} with one entry per input path, in input order.
+    Missing files get an "error" entry instead of failing the whole request.
+    Pages already in the result cache are answered without touching the model.
+    """
+    data = request.json
+    if not data or not isinstance(data.get('filePaths'), list) or not data['filePaths']:
+        return jsonify({"error": "Missing 'filePaths' (non-empty list) in request body"}), 400
+
+    file_paths = data['filePaths']
+    try:
+        batch_size = parse_batch_size(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bypass_cache = bool(data.get('bypassCache', False))
+    started = time.perf_counter()
+    labels = [{"filePath": image_path} for image_path in file_paths]
+    results = [None] * len(file_paths)
+    pending = []
+    keys = {}
+    cache_hits = 0
+    for index, image_path in enumerate(file_paths):
+        if not os.path.exists(image_path):
+            results[index] = {"filePath": image_path, "error": f"File not found: {image_path}"}
+            continue
+        key, cached = cache_lookup(image_path, bypass_cache)
+        if cached is not None:
+            cache_hits += 1
+            results[index] = cached_result(labels[index], cached)
+        else:
+            keys[index] = key
+            pending.append(index)
+
+    try:
+        encoder_ms_saved, queue_wait_ms = analyze_pending(file_paths, labels, keys, pending, batch_size, results)
+    except ModelUnavailable as e:
+        return jsonify({"error": f"Model not ready: {e}"}), 503
+    except Exception as e:
+        logger.error(f"Error analyzing batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    metadata = batch_metadata(batch_size, len(pending), cache_hits, started, encoder_ms_saved, queue_wait_ms)
+    logger.info(f"Analyzed batch of {len(pending)} images (batch size {batch_size}, {cache_hits} cache hits) in {metadata['elapsedMs']} ms")
+    return jsonify({"results": results, "metadata": metadata})
+
+
+def pdf_page_count(pdf_path):
+    document = pdfium.PdfDocument(pdf_path)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+@app.route('/analyze_pdf', methods=['POST'])
+def analyze_pdf():
+    """
+    Analyze pages of a PDF without rasterising them to disk first.
+    Body: {"filePath": "/tmp/n8n_processing/<prefix>input.pdf", "pages": [2, 5], "batchSize": 4, "bypassCache": false}
+    "pages" are 1-based and default to every page. The replicas render each page
+    in memory at the model input size (no PNGs on the shared volume); pages in
+    small print also get a tiled high-resolution OCR pass (metadata.tiled_ocr).
+    Returns {"results": [...]} with one entry per requested page, in request order.
+    """
+    data = request.json
+    if not data or 'filePath' not in data:
+        return jsonify({"error": "Missing 'filePath' in request body"}), 400
+
+    pdf_path = data['filePath']
+    if not os.path.exists(pdf_path):
+        return jsonify({"error": f"File not found: {pdf_path}"}), 404
+    try:
+        batch_size = parse_batch_size(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        total_pages = pdf_page_count(pdf_path)
+    except pdfium.PdfiumError as e:
+        return jsonify({"error": f"Cannot open PDF: {e}", "errorCode": "PDF_UNREADABLE"}), 422
+
+    page_numbers = data.get('pages') or list(range(1, total_pages + 1))
+    if not isinstance(page_numbers, list) or not all(isinstance(n, int) and 1 <= n <= total_pages for n in page_numbers):
+        return jsonify({"error": f"'pages' must be a list of page numbers between 1 and {total_pages}"}), 400
+
+    bypass_cache = bool(data.get('bypassCache', False))
+    started = time.perf_counter()
+    sources = [{"pdf": pdf_path, "page": number} for number in page_numbers]
+    labels = [{"pageNumber": number} for number in page_numbers]
+    results = [None] * len(page_numbers)
+    pending = []
+    keys = {}
+    cache_hits = 0
+    digest = ResultCache.file_digest(pdf_path) if result_cache is not None and not bypass_cache else None
+    for index, number in enumerate(page_numbers):
+        if digest is None:
+            keys[index] = None
+            pending.append(index)
+            continue
+        # Page renders depend on the render settings, so they are part of the key
+        keys[index] = ResultCache.make_key(f"{digest}:page{number}:{PDF_RENDER_TAG}", CACHE_MODEL, CACHE_TASKS)
+        cached = result_cache.get(keys[index])
+        if cached is not None:
+            cache_hits += 1
+            results[index] = cached_result(labels[index], cached)
+        else:
+            pending.append(index)
+
+    try:
+        encoder_ms_saved, queue_wait_ms = analyze_pending(sources, labels, keys, pending, batch_size, results)
+    except ModelUnavailable as e:
+        return jsonify({"error": f"Model not ready: {e}"}), 503
+    except Exception as e:
+        logger.error(f"Error analyzing PDF {pdf_path}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    metadata = batch_metadata(batch_size, len(pending), cache_hits, started, encoder_ms_saved, queue_wait_ms)
+    metadata["totalPages"] = total_pages
+    metadata["tiledPages"] = sum(1 for r in results if r["metadata"]["tiled_ocr"])
+    logger.info(f"Analyzed {len(pending)} of {len(page_numbers)} PDF pages ({cache_hits} cache hits, "
+                f"{metadata['tiledPages']} tiled) in {metadata['elapsedMs']} ms")
+    return jsonify({"results": results, "metadata": metadata})
 
 if __name__ == '__main__':
-    load_model()
+    # Development server: start the model server here instead of from the Gunicorn master
+    import secrets
+    os.environ.setdefault("FLORENCE_IPC_AUTHKEY", secrets.token_hex(16))
+    start_model_server()
     # Run on port 5000
-    app.run(host='0.0.0.0', port=5000)
+    app.run(host='0.0.0.0', port=5000, threaded=True)
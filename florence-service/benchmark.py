@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Florence inference backends (FLORENCE_BACKEND)
+================================================================
+Runs caption + OCR (engine.analyze_paths, the replica code path) over a fixed
+set of sample pages once per backend, each backend in its own process, and
+compares latency, memory and output drift against the fp32 reference.
+
+    docker exec compliance-florence python3 benchmark.py                    # all backends, bundled pages
+    docker exec compliance-florence python3 benchmark.py --backends fp32 int8 --pages /tmp/n8n_processing/scan-*.png
+    docker exec compliance-florence python3 benchmark.py --batch-size 4 --repeat 5 --json /app/cache/bench.json
+
+The bundled pages are rendered deterministically (prose, a questionnaire
+table, a dense form, a sparse diagram page), so runs on different hosts are
+comparable. Each worker loads its own model copy, so on a small host stop the
+service first or expect the extra RAM. Drift is 1 - difflib similarity of the
+text against fp32 per page (0 = identical).
+Exit codes:
+  0 — every backend's worst-page OCR drift is at most --max-drift
+  1 — a backend drifted further, or a worker failed
+"""
+
+import argparse
+import difflib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ["fp32", "bf16", "int8", "compile"]
+
+
+# ── Sample pages ──────────────────────────────────────────────────────────────
+
+PROSE = [
+    "4.2 Access Control Policy",
+    "All privileged accounts must be reviewed quarterly by the system owner.",
+    "Multi-factor authentication is mandatory for remote access to production.",
+    "Service accounts are inventoried and their credentials rotated every 90 days.",
+    "Access requests are approved by the line manager and logged in the ticketing system.",
+    "Terminated employees lose all logical access within 24 hours of their last day.",
+    "Exceptions require written approval from the CISO and expire after six months.",
+]
+
+
+def _font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)  # scalable default font, Pillow >= 10.1
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_sample_pages(directory):
+    """Write the bundled sample pages (A4 at 150 dpi) and return their paths."""
+    from PIL import Image, ImageDraw
+
+    width, height = 1240, 1754
+    pages = []
+
+    def new_page():
+        image = Image.new("RGB", (width, height), "white")
+        return image, ImageDraw.Draw(image)
+
+    # 1. Prose policy page
+    image, draw = new_page()
+    y = 120
+    for i, line in enumerate(PROSE * 3):
+        draw.text((110, y), line, fill="black", font=_font(40 if i == 0 else 26))
+        y += 70 if i == 0 else 44
+    pages.append(image)
+
+    # 2. Questionnaire table
+    image, draw = new_page()
+    draw.text((110, 100), "Compliance Questionnaire - Identity & Access", fill="black", font=_font(36))
+    columns = [110, 260, 860, 1130]
+    rows = [("Control", "Question", "Status")] + [
+        (f"IAM-{i:02d}", f"Is control {i} implemented and evidenced?", ["Yes", "No", "Partial"][i % 3])
+        for i in range(1, 25)
+    ]
+    for r, row in enumerate(rows):
+        top = 200 + r * 56
+        draw.rectangle([columns[0], top, columns[-1], top + 56], outline="black", width=2)
+        for c, cell in enumerate(row):
+            draw.line([columns[c], top, columns[c], top + 56], fill="black", width=2)
+            draw.text((columns[c] + 12, top + 14), cell, fill="black", font=_font(24))
+    pages.append(image)
+
+    # 3. Dense form with small print
+    image, draw = new_page()
+    for i in range(60):
+        draw.text((90, 80 + i * 27), f"{i + 1:02d}. Field {i + 1}: value recorded on 2026-0{i % 9 + 1}-1{i % 9} by auditor #{i * 7 % 31}",
+                  fill="black", font=_font(20))
+    pages.append(image)
+
+    # 4. Sparse diagram page
+    image, draw = new_page()
+    boxes = [("Internet", 140, 300), ("Firewall", 520, 300), ("DMZ", 900, 300),
+             ("App Tier", 520, 800), ("Database", 520, 1300)]
+    for label, x, y in boxes:
+        draw.rectangle([x, y, x + 260, y + 140], outline="black", width=4)
+        draw.text((x + 40, y + 50), label, fill="black", font=_font(32))
+    for (_, x1, y1), (_, x2, y2) in zip(boxes, boxes[1:]):
+        if y1 == y2:
+            draw.line([x1 + 260, y1 + 70, x2, y2 + 70], fill="black", width=4)         # side by side
+        else:
+            draw.line([x1 + 130, y1 + 140, x2 + 130, y2], fill="black", width=4)       # below
+    draw.text((110, 120), "Figure 3: Network segmentation", fill="black", font=_font(36))
+    pages.append(image)
+
+    paths = []
+    for i, image in enumerate(pages, start=1):
+        path = os.path.join(directory, f"bench-page-{i}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+# ── Worker (one backend per process) ──────────────────────────────────────────
+
+def peak_memory_mb(engine):
+    peak = {"rssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}  # KiB on Linux
+    if engine.device == "cuda":
+        peak["cudaMb"] = round(engine.torch.cuda.max_memory_allocated() / 1024 / 1024, 1)
+    return peak
+
+
+def run_worker(backend, paths, batch_size, repeat, threads):
+    import engine
+
+    started = time.perf_counter()
+    engine.load_model(threads, backend)
+    load_s = time.perf_counter() - started
+
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    engine.analyze_paths(batches[0])  # warm-up (torch.compile traces here)
+
+    page_ms, outputs = [], {}
+    for _ in range(repeat):
+        for batch in batches:
+            t = time.perf_counter()
+            results, _ = engine.analyze_paths(batch)
+            page_ms.append((time.perf_counter() - t) * 1000 / len(batch))
+            for path, result in zip(batch, results):
+                outputs[path] = {"description": result["description"], "ocr_text": result["ocr_text"]}
+
+    return {
+        "requested": backend,
+        "backend": engine.backend,
+        "device": engine.device,
+        "loadS": round(load_s, 1),
+        "pageMs": {
+            "median": round(statistics.median(page_ms), 1),
+            "p95": round(sorted(page_ms)[int(len(page_ms) * 0.95)], 1),
+        },
+        "memory": peak_memory_mb(engine),
+        "outputs": outputs,
+    }
+
+
+def spawn_worker(backend, args, paths):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+               "--batch-size", str(args.batch_size), "--repeat", str(args.repeat),
+               "--threads", str(args.threads), "--pages", *paths]
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"requested": backend, "error": proc.stderr.strip().splitlines()[-1:] or [f"exit {proc.returncode}"]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ── Comparison ────────────────────────────────────────────────────────────────
+
+def drift(reference, candidate):
+    return 1 - difflib.SequenceMatcher(None, reference, candidate, autojunk=False).ratio()
+
+
+def compare(reference, report):
+    per_page = {}
+    for path, ref in reference["outputs"].items():
+        out = report["outputs"].get(path, {"description": "", "ocr_text": ""})
+        per_page[os.path.basename(path)] = {
+            "ocr": round(drift(ref["ocr_text"], out["ocr_text"]), 4),
+            "caption": round(drift(ref["description"], out["description"]), 4),
+        }
+    return per_page
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--pages", nargs="+", help="page images to use instead of the bundled samples")
+    parser.add_argument("--batch-size", type=int, default=1, help="pages per analyze call (default 1, like /analyze)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the pages (default 3)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("FLORENCE_TORCH_THREADS", "4")),
+                        help="torch intra-op threads per worker (default FLORENCE_TORCH_THREADS)")
+    parser.add_argument("--max-drift", type=float, default=0.05,
+                        help="fail if any page's OCR drifts further than this from fp32 (default 0.05)")
+    parser.add_argument("--json", help="also write the full report (including outputs) to this file")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.pages, args.batch_size, args.repeat, args.threads)))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="florence-bench-") as directory:
+        paths = args.pages or render_sample_pages(directory)
+        backends = ["fp32"] + [b for b in args.backends if b != "fp32"]
+        reports = {}
+        for backend in backends:
+            print(f"Running {backend} on {len(paths)} pages...", file=sys.stderr)
+            reports[backend] = spawn_worker(backend, args, paths)
+
+    reference = reports["fp32"]
+    if "error" in reference:
+        print(f"fp32 reference failed: {reference['error']}")
+        return 1
+
+    ok = True
+    print(f"{'backend':>8}  {'ran as':>7}  {'load (s)':>8}  {'median ms/page':>14}  {'p95':>8}  {'speedup':>7}  "
+          f"{'peak RSS MB':>11}  {'OCR drift max':>13}  {'caption drift max':>17}")
+    for backend, report in reports.items():
+        if "error" in report:
+            print(f"{backend:>8}  FAILED: {report['error']}")
+            ok = False
+            continue
+        report["drift"] = compare(reference, report)
+        ocr_max = max(d["ocr"] for d in report["drift"].values())
+        caption_max = max(d["caption"] for d in report["drift"].values())
+        speedup = reference["pageMs"]["median"] / report["pageMs"]["median"]
+        print(f"{backend:>8}  {report['backend']:>7}  {report['loadS']:8.1f}  {report['pageMs']['median']:14.1f}  "
+              f"{report['pageMs']['p95']:8.1f}  {speedup:6.2f}x  {report['memory']['rssMb']:11.1f}  "
+              f"{ocr_max:13.4f}  {caption_max:17.4f}")
+        if ocr_max > args.max_drift:
+            print(f"DRIFT: {backend} OCR differs from fp32 by {ocr_max:.4f} > {args.max_drift} on its worst page")
+            ok = False
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
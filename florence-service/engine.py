@@ -0,0 +1,415 @@
+"""
+Florence-2 inference engine.
+
+Imported only inside the model replica processes started by model_server.py,
+so torch, transformers and the model weights are loaded once per replica and
+never in the Gunicorn HTTP workers.
+"""
+
+import gc
+import logging
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+# Mock flash_attn to bypass transformers dynamic module import check.
+# Florence-2's modeling file does `import flash_attn` at the top level.
+# We mock it so the import succeeds, but we force SDPA attention below
+# so flash_attn is never actually called at runtime.
+mock_flash = MagicMock()
+mock_flash.__spec__ = MagicMock()
+mock_flash.__version__ = "2.6.3"
+sys.modules["flash_attn"] = mock_flash
+sys.modules["flash_attn.flash_attn_interface"] = MagicMock()
+sys.modules["flash_attn.bert_padding"] = MagicMock()
+
+import numpy as np
+import pypdfium2 as pdfium
+from PIL import Image
+from transformers import AutoProcessor, AutoModelForCausalLM
+import torch
+
+from model_server import (
+    MODEL_ID, CAPTION_PROMPT, OCR_PROMPT, BACKEND, MODEL_INPUT_SIZE, TILED_OCR, TILE_MAX_LINE_PX, TILE_COLUMNS
+)
+from pdf_render import render_page
+
+logger = logging.getLogger(__name__)
+
+# Global model variables (one model per replica process)
+model = None
+processor = None
+device = "cuda" if torch.cuda.is_available() else "cpu"
+model_id = MODEL_ID
+backend = None          # effective backend after load_model (may fall back to fp32)
+dtype = torch.float32   # dtype of the model weights; pixel values are cast to it
+
+BACKENDS = ("fp32", "bf16", "int8", "compile")
+
+# Tiled OCR returns line boxes so the tiles can be stitched back in page order
+TILED_OCR_PROMPT = "<OCR_WITH_REGION>"
+TILE_OVERLAP = 0.08         # fraction of a tile shared with each neighbour, so no line is cut in both
+MIN_TEXT_LINES = 20         # fewer ink bands than this is not a dense page
+INK_ROW_FRACTION = 0.02     # a pixel row is part of a text line above this share of dark pixels
+
+# Encode each image once and decode caption + OCR from the same features.
+# Set FLORENCE_SHARED_ENCODING=false to fall back to one full generate per task.
+SHARED_ENCODING = os.environ.get("FLORENCE_SHARED_ENCODING", "true").lower() in ("1", "true", "yes")
+
+
+def cpu_supports_bf16():
+    """
+    Native bf16 matmuls need AVX512-BF16 or AMX. Without them PyTorch emulates
+    bf16 and is slower than fp32, so the bf16 backend falls back instead.
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def apply_backend(loaded, requested):
+    """
+    Convert a freshly loaded fp32 model for the requested backend.
+    Returns (model, effective backend, weight dtype).
+
+      fp32    — eager fp32, the reference output
+      bf16    — bf16 weights/activations (CUDA with bf16 support, or AVX512-BF16/AMX CPUs)
+      int8    — dynamic int8 quantisation of every nn.Linear (CPU only; weights
+                stored int8, activations quantised per batch at runtime)
+      compile — fp32 with torch.compile on the vision tower and the language model
+    """
+    if requested not in BACKENDS:
+        logger.warning(f"Unknown FLORENCE_BACKEND '{requested}', using fp32 (choose from {', '.join(BACKENDS)})")
+        return loaded, "fp32", torch.float32
+
+    if requested == "bf16":
+        supported = torch.cuda.is_bf16_supported() if device == "cuda" else cpu_supports_bf16()
+        if not supported:
+            logger.warning(f"bf16 is not natively supported on this {device}, using fp32")
+            return loaded, "fp32", torch.float32
+        return loaded.to(torch.bfloat16), "bf16", torch.bfloat16
+
+    if requested == "int8":
+        if device != "cpu":
+            logger.warning("Dynamic int8 quantisation only runs on CPU, using fp32 on cuda")
+            return loaded, "fp32", torch.float32
+        quantized = torch.ao.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8)
+        return quantized, "int8", torch.float32
+
+    if requested == "compile":
+        # Compile the forward methods in place so generate() and the shared-encoding
+        # path (_encode_image / get_input_embeddings) keep working on the same module.
+        # The vision tower always sees 768x768 inputs; decoder lengths vary, hence dynamic.
+        loaded.vision_tower.forward = torch.compile(loaded.vision_tower.forward)
+        loaded.language_model.forward = torch.compile(loaded.language_model.forward, dynamic=True)
+        return loaded, "compile", torch.float32
+
+    return loaded, "fp32", torch.float32
+
+
+def load_model(num_threads, requested_backend=BACKEND):
+    global model, processor, backend, dtype
+    # Intra-op threads are set explicitly per replica (FLORENCE_TORCH_THREADS / replicas);
+    # one inter-op thread, since each replica runs one generate call at a time
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    logger.info(f"Loading model: {model_id} on {device} with {num_threads} torch threads...")
+    try:
+        # Use SDPA (Scaled Dot Product Attention) — built into PyTorch 2.0+
+        # This avoids needing the external flash_attn package while still being fast on A10
+        loaded = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            trust_remote_code=True,
+            attn_implementation="sdpa"
+        ).to(device)
+        loaded.eval() # Explicitly set to eval mode
+        model, backend, dtype = apply_backend(loaded, requested_backend)
+        processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+        logger.info(f"Model loaded successfully ({backend} backend).")
+    except Exception as e:
+        logger.error(f"Failed to load model: {str(e)}")
+        raise e
+
+
+def _generate_and_parse(images, task_prompt, **generate_inputs):
+    """Greedy-decode one task for a batch and post-process each result."""
+    generated_ids = model.generate(
+        max_new_tokens=1024,
+        do_sample=False,
+        num_beams=1,
+        **generate_inputs
+    )
+    generated_texts = processor.batch_decode(generated_ids, skip_special_tokens=False)
+    parsed = [
+        processor.post_process_generation(
+            generated_text,
+            task=task_prompt,
+            image_size=(image.width, image.height)
+        )
+        for generated_text, image in zip(generated_texts, images)
+    ]
+    del generated_ids, generated_texts
+    return parsed
+
+
+def run_task_batch(images, task_prompt):
+    """
+    Run one Florence-2 task over a list of images in a single generate call.
+    The processor resizes every image to the model input size and pads the
+    prompt tokens, so the batch stacks into one tensor. Results keep input order.
+    """
+    with torch.inference_mode():
+        inputs = processor(
+            text=[task_prompt] * len(images),
+            images=images,
+            return_tensors="pt",
+            padding=True
+        ).to(device)
+        parsed = _generate_and_parse(
+            images,
+            task_prompt,
+            input_ids=inputs["input_ids"],
+            pixel_values=inputs["pixel_values"].to(dtype)
+        )
+        del inputs
+        return parsed
+
+
+def encode_images(images):
+    """
+    Run the vision encoder (DaViT + projection) once for a batch of images.
+    The returned features can be merged with any task prompt, so caption and
+    OCR no longer pay for the image encoder twice.
+    """
+    with torch.inference_mode():
+        pixel_values = processor.image_processor(images, return_tensors="pt")["pixel_values"].to(device, dtype)
+        image_features = model._encode_image(pixel_values)
+        del pixel_values
+        return image_features
+
+
+def run_task_encoded(images, image_features, task_prompt):
+    """Decode one task prompt from image features produced by encode_images()."""
+    with torch.inference_mode():
+        prompts = processor._construct_prompts([task_prompt] * len(images))
+        input_ids = processor.tokenizer(prompts, return_tensors="pt", padding=True)["input_ids"].to(device)
+        inputs_embeds = model.get_input_embeddings()(input_ids)
+        inputs_embeds, _ = model._merge_input_ids_with_image_features(image_features, inputs_embeds)
+        # Passing inputs_embeds makes Florence-2 skip its own image encoding step
+        parsed = _generate_and_parse(images, task_prompt, input_ids=None, inputs_embeds=inputs_embeds)
+        del input_ids, inputs_embeds
+        return parsed
+
+
+def load_image(image_path):
+    image = Image.open(image_path)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def load_sources(sources):
+    """
+    Images for a batch of page sources: image paths are opened, PDF pages come
+    pre-rendered from the model server's render pool ("image": (size, RGB bytes))
+    or, with the pool disabled, are rendered here with each PDF opened once.
+    """
+    documents = {}
+    try:
+        images = []
+        for source in sources:
+            if isinstance(source, str):
+                images.append(load_image(source))
+                continue
+            if "image" in source:
+                size, pixels = source["image"]
+                images.append(Image.frombytes("RGB", size, pixels))
+                continue
+            document = documents.get(source["pdf"])
+            if document is None:
+                document = documents[source["pdf"]] = pdfium.PdfDocument(source["pdf"])
+            images.append(render_page(document, source["page"], MODEL_INPUT_SIZE))
+        return images
+    finally:
+        for document in documents.values():
+            document.close()
+
+
+def text_line_heights(image):
+    """Heights in pixels of the horizontal ink bands of a page, a cheap proxy for its text lines."""
+    gray = np.asarray(image.convert("L"))
+    ink_rows = (gray < 128).mean(axis=1) > INK_ROW_FRACTION
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], ink_rows, [False])).astype(np.int8)))
+    heights = edges[1::2] - edges[0::2]
+    return heights[heights > 1]  # rules and specks
+
+
+def is_small_print(image):
+    """
+    True when the page's median text line, once the processor squeezes the page
+    to MODEL_INPUT_SIZE px high, is shorter than TILE_MAX_LINE_PX: too small for
+    reliable OCR at model resolution.
+    """
+    heights = text_line_heights(image)
+    if len(heights) < MIN_TEXT_LINES:
+        return False
+    return float(np.median(heights)) * MODEL_INPUT_SIZE / image.height < TILE_MAX_LINE_PX
+
+
+def tile_grid(width, height):
+    """
+    Split a page into near-square cells, TILE_COLUMNS across its shorter side.
+    Returns [(crop box, core box)]: the crop overlaps its neighbours by
+    TILE_OVERLAP, the core is the cell itself and decides which tile owns a line.
+    """
+    cell = min(width, height) / TILE_COLUMNS
+    columns, rows = max(1, round(width / cell)), max(1, round(height / cell))
+    step_x, step_y = width / columns, height / rows
+    pad_x, pad_y = int(step_x * TILE_OVERLAP), int(step_y * TILE_OVERLAP)
+    grid = []
+    for row in range(rows):
+        for column in range(columns):
+            core = (int(column * step_x), int(row * step_y), int((column + 1) * step_x), int((row + 1) * step_y))
+            crop = (max(0, core[0] - pad_x), max(0, core[1] - pad_y), min(width, core[2] + pad_x), min(height, core[3] + pad_y))
+            grid.append((crop, core))
+    return grid
+
+
+def stitch_lines(boxes):
+    """Join (top, bottom, left, text) line boxes into reading order: rows top to bottom, left to right."""
+    rows = []
+    for top, bottom, left, text in sorted(boxes):
+        centre = (top + bottom) / 2
+        if rows and rows[-1]["top"] <= centre <= rows[-1]["bottom"]:
+            rows[-1]["parts"].append((left, text))
+            rows[-1]["bottom"] = max(rows[-1]["bottom"], bottom)
+        else:
+            rows.append({"top": top, "bottom": bottom, "parts": [(left, text)]})
+    return "\n".join(" ".join(text for _, text in sorted(row["parts"])) for row in rows)
+
+
+def tiled_ocr(pdf_path, page_number):
+    """
+    OCR a small-print page from TILE_COLUMNS x the model resolution: render it
+    once in memory, run <OCR_WITH_REGION> on all overlapping tiles as one batch
+    and put the lines back together by their page coordinates.
+    """
+    document = pdfium.PdfDocument(pdf_path)
+    try:
+        image = render_page(document, page_number, MODEL_INPUT_SIZE * TILE_COLUMNS)
+    finally:
+        document.close()
+
+    grid = tile_grid(image.width, image.height)
+    tiles = [image.crop(crop) for crop, _ in grid]
+    boxes = []
+    for (crop, core), parsed in zip(grid, run_task_batch(tiles, TILED_OCR_PROMPT)):
+        region = parsed.get(TILED_OCR_PROMPT, {})
+        for quad, label in zip(region.get("quad_boxes", []), region.get("labels", [])):
+            xs = [crop[0] + x for x in quad[0::2]]
+            ys = [crop[1] + y for y in quad[1::2]]
+            centre_x, centre_y = sum(xs) / len(xs), sum(ys) / len(ys)
+            # Lines in the overlap are read by both tiles; keep the copy whose core holds the centre
+            if not (core[0] <= centre_x < core[2] and core[1] <= centre_y < core[3]):
+                continue
+            text = label.replace("</s>", "").strip()
+            if text:
+                boxes.append((min(ys), max(ys), min(xs), text))
+    del image, tiles
+    return stitch_lines(boxes), len(grid)
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def analyze_images(images):
+    """
+    Caption + OCR for a batch of images.
+    Returns (results, timings): one dict per image in input order, plus the
+    batch timings in milliseconds. With SHARED_ENCODING the image encoder runs
+    once per batch and both prompts are decoded from the cached features.
+    """
+    started = time.perf_counter()
+    timings = {"sharedEncoding": SHARED_ENCODING, "backend": backend}
+
+    if SHARED_ENCODING:
+        t = time.perf_counter()
+        image_features = encode_images(images)
+        timings["encodeMs"] = _elapsed_ms(t)
+
+        # Task 1: Visual description (for diagram detection & image understanding)
+        t = time.perf_counter()
+        captions = run_task_encoded(images, image_features, CAPTION_PROMPT)
+        timings["captionMs"] = _elapsed_ms(t)
+
+        # Task 2: OCR text extraction (replaces Tesseract)
+        t = time.perf_counter()
+        ocrs = run_task_encoded(images, image_features, OCR_PROMPT)
+        timings["ocrMs"] = _elapsed_ms(t)
+
+        del image_features
+        # The unshared path would have encoded once more per additional task
+        timings["encoderMsSaved"] = timings["encodeMs"]
+    else:
+        t = time.perf_counter()
+        captions = run_task_batch(images, CAPTION_PROMPT)
+        timings["captionMs"] = _elapsed_ms(t)
+
+        t = time.perf_counter()
+        ocrs = run_task_batch(images, OCR_PROMPT)
+        timings["ocrMs"] = _elapsed_ms(t)
+        timings["encoderMsSaved"] = 0
+
+    timings["totalMs"] = _elapsed_ms(started)
+    timings["perPageMs"] = round(timings["totalMs"] / len(images), 1)
+
+    results = [
+        {
+            "description": caption.get(CAPTION_PROMPT, ""),
+            "ocr_text": ocr.get(OCR_PROMPT, "")
+        }
+        for caption, ocr in zip(captions, ocrs)
+    ]
+    return results, timings
+
+
+def analyze_paths(sources):
+    """
+    Entry point used by the replica loop: open or render the page sources, run
+    caption + OCR as one batch and attach each image's size. PDF pages in small
+    print get their OCR text replaced by a tiled high-resolution pass. Images
+    are only held for the duration of the batch.
+    """
+    images = load_sources(sources)
+    try:
+        results, timings = analyze_images(images)
+        started = time.perf_counter()
+        tiled_pages = tiles = 0
+        for source, result, image in zip(sources, results, images):
+            result["image_size"] = image.size
+            result["tiled_ocr"] = False
+            if TILED_OCR and not isinstance(source, str) and is_small_print(image):
+                result["ocr_text"], count = tiled_ocr(source["pdf"], source["page"])
+                result["tiled_ocr"] = True
+                tiled_pages += 1
+                tiles += count
+        if tiled_pages:
+            timings["tiledPages"] = tiled_pages
+            timings["tiles"] = tiles
+            timings["tiledOcrMs"] = _elapsed_ms(started)
+            timings["totalMs"] = round(timings["totalMs"] + timings["tiledOcrMs"], 1)
+        return results, timings
+    finally:
+        del images
+        release_memory()
+
+
+def release_memory():
+    gc.collect()
+    if device == "cuda":
+        torch.cuda.empty_cache()
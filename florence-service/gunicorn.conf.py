@@ -0,0 +1,31 @@
+"""
+Gunicorn configuration for the Florence service.
+
+The master process starts the model server (model_server.py) before forking
+the HTTP workers, so the host holds FLORENCE_REPLICAS copies of Florence-2
+regardless of how many HTTP workers and threads serve requests. Workers only
+wait on the model server, so threads are cheap.
+"""
+
+import os
+import secrets
+
+bind = "0.0.0.0:5000"
+# Increased timeout for large image processing
+timeout = 600
+workers = int(os.environ.get("FLORENCE_HTTP_WORKERS", "2"))
+threads = int(os.environ.get("FLORENCE_HTTP_THREADS", "4"))
+
+
+def on_starting(server):
+    # Shared secret for the model server socket; inherited by the forked workers
+    os.environ.setdefault("FLORENCE_IPC_AUTHKEY", secrets.token_hex(16))
+    import model_server
+    server.model_server = model_server.start()
+
+
+def on_exit(server):
+    process = getattr(server, "model_server", None)
+    if process is not None and process.is_alive():
+        process.terminate()
+        process.join(10)
@@ -0,0 +1,572 @@
+"""
+Florence model server: the single owner of the model weights on a host.
+
+Gunicorn HTTP workers no longer load Florence-2 themselves. The Gunicorn master
+starts one model server process (see gunicorn.conf.py), which spawns
+FLORENCE_REPLICAS replica processes, each holding one copy of the model and
+FLORENCE_TORCH_THREADS / FLORENCE_REPLICAS torch threads. HTTP workers talk to
+the server over a Unix socket (multiprocessing.connection, pickled messages):
+
+    worker ──{"id", "op": "analyze", "paths": [...]}──▶ server ──▶ batcher ──▶ job queue ──▶ replica
+    worker ◀──{"id", "results": [...], "timings"}────── server ◀── event queue ◀──────────────┘
+
+Jobs are page sources on the shared volume: an image path, or {"pdf": path,
+"page": n} for a PDF page. PDF pages are rendered by a pool of
+FLORENCE_RENDER_WORKERS processes as soon as a job arrives, in parallel across
+cores, and a job joins the batcher the moment its pages are rendered, so
+rendering of later pages overlaps inference of earlier ones. Pages rendered but
+not yet analysed are capped at FLORENCE_RENDER_AHEAD_PAGES (the bounded queue
+between the two stages); their raw pixels travel with the job to the replica.
+The batcher
+coalesces jobs from all HTTP workers into one generate batch: it waits up to
+FLORENCE_BATCH_WINDOW_MS after the oldest waiting job for more pages, dispatches
+as soon as FLORENCE_MAX_BATCH_SIZE pages are waiting, and keeps collecting while
+every replica is busy. Each caller gets its own slice of the batch back, with
+the time its pages spent waiting (queueWaitMs). A replica that dies is
+restarted, and the batch it was running is answered with an error.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+
+import pdf_render
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = 'microsoft/Florence-2-large-ft'
+CAPTION_PROMPT = "<MORE_DETAILED_CAPTION>"
+OCR_PROMPT = "<OCR>"
+
+SOCKET_PATH = os.environ.get("FLORENCE_SOCKET", "/tmp/florence-model.sock")
+REPLICAS = max(1, int(os.environ.get("FLORENCE_REPLICAS", "1")))
+TORCH_THREADS = max(1, int(os.environ.get("FLORENCE_TORCH_THREADS", "4")))
+# Inference backend applied by engine.load_model: fp32 | bf16 | int8 | compile
+BACKEND = os.environ.get("FLORENCE_BACKEND", "fp32").lower()
+# PDF pages (/analyze_pdf) are rendered in memory at the model input size; pages whose
+# text lines are shorter than TILE_MAX_LINE_PX at that size get a tiled OCR pass
+MODEL_INPUT_SIZE = 768      # Florence-2 image processor resizes every image to 768x768
+TILED_OCR = os.environ.get("FLORENCE_TILED_OCR", "true").lower() in ("1", "true", "yes")
+TILE_MAX_LINE_PX = float(os.environ.get("FLORENCE_TILE_MAX_LINE_PX", "6"))
+TILE_COLUMNS = max(2, int(os.environ.get("FLORENCE_TILE_COLUMNS", "2")))
+# PDF render pool (0 = replicas render their own pages, unset/empty = min(4, CPUs)) and how
+# many rendered pages may wait for or sit in the replicas (0 = two full batches per replica)
+RENDER_WORKERS = max(0, int(os.environ.get("FLORENCE_RENDER_WORKERS") or min(4, os.cpu_count() or 1)))
+RENDER_AHEAD_PAGES = max(0, int(os.environ.get("FLORENCE_RENDER_AHEAD_PAGES") or 0))
+# Upper bound on images per model.generate() call, across all coalesced requests
+MAX_BATCH_SIZE = max(1, int(os.environ.get("FLORENCE_MAX_BATCH_SIZE", "4")))
+# How long the oldest waiting page may wait for others to join its batch
+BATCH_WINDOW_MS = max(0.0, float(os.environ.get("FLORENCE_BATCH_WINDOW_MS", "25")))
+WAIT_SAMPLES = 1000         # recent queue waits kept for the status percentiles
+AUTHKEY_ENV = "FLORENCE_IPC_AUTHKEY"
+REQUEST_TIMEOUT = 600       # seconds without any reply; matches the Gunicorn worker timeout
+RESTART_DELAY = 5           # seconds before a dead replica is started again
+
+
+class ModelUnavailable(Exception):
+    """The model server cannot be reached (starting up or restarting)."""
+
+
+class ModelError(Exception):
+    """A replica failed while analysing a job."""
+
+
+# ── Replica process ───────────────────────────────────────────────────────────
+
+def replica_main(index, num_threads, jobs, events):
+    logging.basicConfig(level=logging.INFO)
+    try:
+        import engine
+        engine.load_model(num_threads, BACKEND)
+    except Exception as e:
+        events.put(("failed", index, None, str(e)))
+        return
+    events.put(("ready", index, None, {"device": engine.device, "backend": engine.backend}))
+
+    while True:
+        job_id, paths = jobs.get()
+        events.put(("started", index, job_id, None))
+        try:
+            results, timings = engine.analyze_paths(paths)
+            payload = {"results": results, "timings": timings}
+        except Exception as e:
+            logger.error(f"Replica {index} failed on job {job_id}: {e}")
+            payload = {"error": str(e)}
+        events.put(("done", index, job_id, payload))
+
+
+# ── Server process ────────────────────────────────────────────────────────────
+
+class ModelServer:
+    def __init__(self, address, authkey, replicas, torch_threads,
+                 max_batch_size=MAX_BATCH_SIZE, batch_window_ms=BATCH_WINDOW_MS,
+                 render_workers=RENDER_WORKERS, render_ahead_pages=RENDER_AHEAD_PAGES):
+        self.address = address
+        self.authkey = authkey
+        self.threads_per_replica = max(1, torch_threads // replicas)
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.render_workers = render_workers
+        self.render_ahead = render_ahead_pages or 2 * max_batch_size * replicas
+        self.ctx = mp.get_context("spawn")  # CUDA cannot be initialised in a forked child
+        self.jobs = self.ctx.Queue()
+        # SimpleQueue writes synchronously: a replica's "started" event is on the pipe
+        # before it touches the job, so a crash mid-job is always attributed to it
+        self.events = self.ctx.SimpleQueue()
+        self.processes = [None] * replicas
+        self.ready = set()
+        self.busy = {}          # replica index -> batch id
+        self.pending = {}       # job id -> (connection, send lock)
+        self.waiting = deque()  # (job id, paths, enqueued at) not yet batched
+        self.batches = {}       # batch id -> [(job id, paths, enqueued at)]
+        self.started = {}       # batch id -> when a replica picked it up
+        self.in_flight = 0      # batches handed to the replicas and not finished
+        self.device = None
+        self.backend = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stats = {"batches": 0, "pages": 0, "jobs": 0}
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.render_pool = None
+        self.stopping = False
+        self.render_backlog = deque()   # (job id, sources, enqueued at) waiting for render capacity
+        self.render_in_use = 0          # rendered pages not yet analysed, plus pages being rendered
+        self.render_ms = {}             # job id -> wall time to render its pages
+        self.render_stats = {"pages": 0, "ms": 0.0}
+
+    def start_replica(self, index):
+        process = self.ctx.Process(
+            target=replica_main,
+            args=(index, self.threads_per_replica, self.jobs, self.events),
+            name=f"florence-replica-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def reply(self, job_id, payload):
+        with self.lock:
+            target = self.pending.pop(job_id, None)
+        if target is None:
+            return
+        conn, send_lock = target
+        try:
+            with send_lock:
+                conn.send({"id": job_id, **payload})
+        except (OSError, EOFError):
+            pass  # the HTTP worker went away; nothing to answer
+
+    def route_events(self):
+        while True:
+            kind, index, job_id, payload = self.events.get()
+            if kind == "ready":
+                self.device, self.backend = payload["device"], payload["backend"]
+                with self.lock:
+                    self.ready.add(index)
+                    self.changed.notify_all()
+                logger.info(f"Replica {index} ready on {self.device}, {self.backend} backend "
+                            f"({self.threads_per_replica} torch threads)")
+            elif kind == "failed":
+                logger.error(f"Replica {index} failed to load the model: {payload}")
+            elif kind == "started":
+                with self.lock:
+                    self.busy[index] = job_id
+                    self.started[job_id] = started = time.monotonic()
+                    for _, _, enqueued in self.batches.get(job_id, ()):
+                        self.waits.append(started - enqueued)
+            elif kind == "done":
+                with self.lock:
+                    self.busy.pop(index, None)
+                self.finish(job_id, payload)
+
+    def monitor(self):
+        while not self.stopping:
+            time.sleep(RESTART_DELAY)
+            for index, process in enumerate(self.processes):
+                if self.stopping:
+                    return
+                if process.is_alive():
+                    continue
+                with self.lock:
+                    self.ready.discard(index)
+                    job_id = self.busy.pop(index, None)
+                if job_id is not None:
+                    self.finish(job_id, {"error": f"Florence replica {index} exited (code {process.exitcode}) during the job"})
+                logger.warning(f"Replica {index} exited with code {process.exitcode}, restarting")
+                self.start_replica(index)
+
+    def submit(self, job_id, sources, conn, send_lock):
+        with self.lock:
+            self.pending[job_id] = (conn, send_lock)
+            job = (job_id, sources, time.monotonic())
+            if self.render_pool is not None and any(not isinstance(source, str) for source in sources):
+                self.render_backlog.append(job)
+            else:
+                self.waiting.append(job)
+            self.changed.notify_all()
+
+    # ── Render stage ──
+
+    @staticmethod
+    def _rendered_pages(sources):
+        return sum(1 for source in sources if not isinstance(source, str) and "image" in source)
+
+    def _render_capacity(self):
+        """Called with self.lock held: can the next backlog job start rendering?"""
+        if not self.render_backlog:
+            return False
+        pages = sum(1 for source in self.render_backlog[0][1] if not isinstance(source, str))
+        return self.render_in_use == 0 or self.render_in_use + pages <= self.render_ahead
+
+    def render_feeder(self):
+        """
+        Start rendering backlog jobs, oldest first, while the rendered-ahead pages
+        stay within render_ahead, so a 500-page PDF is never held decoded at once
+        and rendering never runs more than a couple of batches ahead of the replicas.
+        """
+        while True:
+            with self.lock:
+                while not self._render_capacity():
+                    self.changed.wait()
+                job = self.render_backlog.popleft()
+                if job[0] not in self.pending:
+                    continue  # the caller disconnected while waiting
+                pages = [source for source in job[1] if not isinstance(source, str)]
+                self.render_in_use += len(pages)
+                pool = self.render_pool
+            self.start_render(pool, job, pages)
+
+    def start_render(self, pool, job, pages):
+        started = time.monotonic()
+        try:
+            futures = [pool.submit(pdf_render.render_to_bytes, page["pdf"], page["page"], MODEL_INPUT_SIZE)
+                       for page in pages]
+        except BrokenProcessPool as e:
+            self.render_failed(pool, job, len(pages), e)
+            return
+        remaining = [len(futures)]
+
+        def page_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.rendered(pool, job, futures, started)
+
+        for future in futures:
+            future.add_done_callback(page_done)
+
+    def rendered(self, pool, job, futures, started):
+        """All pages of a job are rendered: hand it to the batcher with the pixels attached."""
+        job_id, sources, enqueued = job
+        try:
+            images = [future.result() for future in futures]
+        except Exception as e:
+            self.render_failed(pool, job, len(futures), e)
+            return
+        pixels = iter(images)
+        ready = []
+        for source in sources:
+            if isinstance(source, str):
+                ready.append(source)
+            else:
+                size, data, _ = next(pixels)
+                ready.append({**source, "image": (size, data)})
+        with self.lock:
+            self.render_ms[job_id] = round((time.monotonic() - started) * 1000, 1)
+            self.render_stats["pages"] += len(images)
+            self.render_stats["ms"] += sum(ms for _, _, ms in images)
+            self.waiting.append((job_id, ready, enqueued))
+            self.changed.notify_all()
+
+    def render_failed(self, pool, job, pages, error):
+        with self.lock:
+            self.render_in_use -= pages
+            if isinstance(error, BrokenProcessPool) and self.render_pool is pool:
+                # A render process died (e.g. a malformed PDF crashed pdfium): start a fresh pool
+                logger.warning(f"Render pool broken ({error}), restarting it")
+                self.render_pool = ProcessPoolExecutor(self.render_workers, mp_context=self.ctx)
+            self.changed.notify_all()
+        self.reply(job[0], {"error": f"Rendering PDF page failed: {error}"})
+
+    # ── Batch stage ──
+
+    def _waiting_pages(self):
+        return sum(len(paths) for _, paths, _ in self.waiting)
+
+    def _next_batch(self):
+        """
+        Block until a batch should be dispatched, then take it off the waiting
+        queue. Called with self.lock held. A batch goes out when it is full, or
+        when the oldest job has waited out the window and a replica is idle.
+        Jobs are never split, so a request's pages stay in one generate call.
+        """
+        while True:
+            if not self.waiting:
+                self.changed.wait()
+                continue
+            if self._waiting_pages() >= self.max_batch_size:
+                break
+            remaining = self.waiting[0][2] + self.batch_window - time.monotonic()
+            if remaining > 0:
+                self.changed.wait(remaining)
+            elif self.in_flight < len(self.ready):
+                break
+            else:
+                self.changed.wait()  # window over but every replica is busy: keep collecting
+
+        members, pages = [], 0
+        while self.waiting and (not pages or pages + len(self.waiting[0][1]) <= self.max_batch_size):
+            member = self.waiting.popleft()
+            if member[0] not in self.pending:
+                self.render_in_use -= self._rendered_pages(member[1])
+                self.render_ms.pop(member[0], None)
+                continue  # the caller disconnected while waiting
+            members.append(member)
+            pages += len(member[1])
+        return members
+
+    def dispatch(self, members):
+        """Hand one batch to the replicas. Called with self.lock held."""
+        batch_id = uuid.uuid4().hex
+        paths = [path for _, job_paths, _ in members for path in job_paths]
+        self.batches[batch_id] = members
+        self.in_flight += 1
+        self.stats["batches"] += 1
+        self.stats["pages"] += len(paths)
+        self.stats["jobs"] += len(members)
+        self.jobs.put((batch_id, paths))
+
+    def batcher(self):
+        while True:
+            with self.lock:
+                members = self._next_batch()
+                if members:
+                    self.dispatch(members)
+
+    def finish(self, batch_id, payload):
+        """Split a finished batch back into one reply per coalesced job."""
+        with self.lock:
+            members = self.batches.pop(batch_id, None)
+            started = self.started.pop(batch_id, time.monotonic())
+            if members is None:
+                return
+            self.in_flight -= 1
+            self.changed.notify_all()
+            if "error" in payload and len(members) > 1:
+                # One bad page must not fail other callers' pages: rerun each job alone
+                logger.warning(f"Batch of {len(members)} jobs failed ({payload['error']}), retrying them one by one")
+                for member in members:
+                    self.dispatch([member])
+                return
+            # Rendered pages count against the render budget until they are analysed
+            self.render_in_use -= sum(self._rendered_pages(sources) for _, sources, _ in members)
+            render_ms = {job_id: self.render_ms.pop(job_id, None) for job_id, _, _ in members}
+        if "error" in payload:
+            self.reply(members[0][0], payload)
+            return
+        pages = sum(len(paths) for _, paths, _ in members)
+        offset = 0
+        for job_id, paths, enqueued in members:
+            count = len(paths)
+            timings = {
+                **payload["timings"],
+                "batchPages": pages,
+                "batchRequests": len(members),
+                # Rendering, waiting for the batch window and for a free replica
+                "queueWaitMs": round((started - enqueued) * 1000, 1)
+            }
+            if render_ms[job_id] is not None:
+                timings["renderMs"] = render_ms[job_id]
+            self.reply(job_id, {"results": payload["results"][offset:offset + count], "timings": timings})
+            offset += count
+
+    def status(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            batches = self.stats["batches"]
+            return {
+                "replicas": len(self.processes),
+                "ready": len(self.ready),
+                "busy": len(self.busy),
+                "pending": len(self.pending),
+                "device": self.device,
+                "backend": self.backend,
+                "torchThreadsPerReplica": self.threads_per_replica,
+                "batching": {
+                    "maxBatchSize": self.max_batch_size,
+                    "windowMs": self.batch_window * 1000,
+                    "waitingPages": self._waiting_pages(),
+                    "inFlightBatches": self.in_flight,
+                    "batches": batches,
+                    "avgBatchPages": round(self.stats["pages"] / batches, 2) if batches else 0,
+                    "avgBatchRequests": round(self.stats["jobs"] / batches, 2) if batches else 0,
+                    # Over the last WAIT_SAMPLES jobs, from arrival until a replica started them
+                    "queueWaitMs": {
+                        "avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0,
+                        "p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0,
+                        "max": round(waits[-1] * 1000, 1) if waits else 0
+                    }
+                },
+                "rendering": {
+                    "workers": self.render_workers if self.render_pool is not None else 0,
+                    "aheadPages": self.render_ahead,
+                    "inUsePages": self.render_in_use,
+                    "backlogJobs": len(self.render_backlog),
+                    "pages": self.render_stats["pages"],
+                    "avgPageMs": round(self.render_stats["ms"] / self.render_stats["pages"], 1)
+                    if self.render_stats["pages"] else 0
+                }
+            }
+
+    def handle(self, conn):
+        send_lock = threading.Lock()
+        try:
+            while True:
+                message = conn.recv()
+                if message["op"] == "status":
+                    with send_lock:
+                        conn.send({"id": message["id"], "status": self.status()})
+                elif message["op"] == "analyze":
+                    self.submit(message["id"], message["paths"], conn, send_lock)
+                else:
+                    with send_lock:
+                        conn.send({"id": message["id"], "error": f"Unknown op: {message['op']}"})
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.lock:
+                for job_id in [j for j, (c, _) in self.pending.items() if c is conn]:
+                    del self.pending[job_id]
+            conn.close()
+
+    def serve(self):
+        for index in range(len(self.processes)):
+            self.start_replica(index)
+        if self.render_workers:
+            self.render_pool = ProcessPoolExecutor(self.render_workers, mp_context=self.ctx)
+            threading.Thread(target=self.render_feeder, daemon=True).start()
+        threading.Thread(target=self.route_events, daemon=True).start()
+        threading.Thread(target=self.batcher, daemon=True).start()
+        threading.Thread(target=self.monitor, daemon=True).start()
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info(f"Model server listening on {self.address} with {len(self.processes)} replica(s)")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError) as e:
+                    logger.warning(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+    def stop(self):
+        self.stopping = True
+        if self.render_pool is not None:
+            # Pool processes are not daemonic: stop them before multiprocessing joins its
+            # children on exit (queued renders are dropped, running ones take milliseconds)
+            self.render_pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_server(address, authkey, replicas, torch_threads):
+    logging.basicConfig(level=logging.INFO)
+    # Exit through SystemExit on SIGTERM so multiprocessing stops the replicas too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = ModelServer(address, authkey, replicas, torch_threads)
+    try:
+        server.serve()
+    finally:
+        server.stop()
+
+
+def start(address=SOCKET_PATH, replicas=REPLICAS, torch_threads=TORCH_THREADS):
+    """Start the model server process (called once, from the Gunicorn master)."""
+    authkey = os.environ[AUTHKEY_ENV].encode()
+    process = mp.get_context("spawn").Process(
+        target=run_server,
+        args=(address, authkey, replicas, torch_threads),
+        name="florence-model-server"
+    )
+    process.start()
+    return process
+
+
+# ── Client (HTTP workers) ─────────────────────────────────────────────────────
+
+class ModelClient:
+    """One connection per HTTP worker thread; jobs are pipelined over it."""
+
+    def __init__(self, address=SOCKET_PATH, timeout=REQUEST_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=os.environ[AUTHKEY_ENV].encode())
+            except (OSError, EOFError) as e:
+                raise ModelUnavailable(f"Model server not reachable at {self.address}: {e}")
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def _call(self, requests):
+        """
+        Send every request, then collect the replies (in any order) by id. The
+        timeout applies between replies, not to the whole call: a long deck
+        queued behind other requests keeps waiting as long as its batches
+        keep finishing.
+        """
+        conn = self._connection()
+        try:
+            for message in requests:
+                conn.send(message)
+            replies = {}
+            while len(replies) < len(requests):
+                if not conn.poll(self.timeout):
+                    raise ModelError(f"No answer from the model server for {self.timeout}s "
+                                     f"({len(replies)}/{len(requests)} batches done)")
+                reply = conn.recv()
+                replies[reply["id"]] = reply
+        except (OSError, EOFError) as e:
+            self._drop()
+            raise ModelUnavailable(f"Lost connection to the model server: {e}")
+        except ModelError:
+            self._drop()  # late replies must not leak into the next request on this connection
+            raise
+        return [replies[message["id"]] for message in requests]
+
+    def status(self):
+        return self._call([{"id": uuid.uuid4().hex, "op": "status"}])[0]["status"]
+
+    def analyze(self, batches):
+        """
+        Caption + OCR for a list of page source batches (image paths or
+        {"pdf", "page"} dicts). All batches are queued at once, so several
+        replicas can work on one request. Returns [(results, timings)] in batch
+        order; results carry description, ocr_text, image_size and tiled_ocr.
+        """
+        replies = self._call([{"id": uuid.uuid4().hex, "op": "analyze", "paths": paths} for paths in batches])
+        for reply in replies:
+            if "error" in reply:
+                raise ModelError(reply["error"])
+        return [(reply["results"], reply["timings"]) for reply in replies]
@@ -0,0 +1,53 @@
+"""
+In-memory PDF page rendering with pypdfium2.
+
+Used by the model server's render pool (render_to_bytes, one page per task, in
+parallel across cores) and by the replicas (tiled OCR re-renders). Kept free of
+torch so render pool processes start in well under a second.
+"""
+
+import os
+import time
+
+import pypdfium2 as pdfium
+
+OPEN_DOCUMENTS = 2      # per render process; documents of the same request stay open between pages
+
+_documents = {}         # (path, mtime, size) -> PdfDocument
+
+
+def render_page(document, page_number, min_side):
+    """
+    Rasterise one PDF page in memory so its shorter side is min_side pixels.
+    At the model input size this is the resolution the processor keeps anyway,
+    so nothing is rendered (or PNG-encoded) only to be downsampled again.
+    """
+    page = document[page_number - 1]
+    try:
+        width, height = page.get_size()  # points, rotation applied
+        image = page.render(scale=min_side / min(width, height)).to_pil()
+    finally:
+        page.close()
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def open_document(path):
+    """Open a PDF, reusing a handle from this process while the file is unchanged."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    document = _documents.get(key)
+    if document is None:
+        while len(_documents) >= OPEN_DOCUMENTS:
+            _documents.pop(next(iter(_documents))).close()
+        document = _documents[key] = pdfium.PdfDocument(path)
+    return document
+
+
+def render_to_bytes(pdf_path, page_number, min_side):
+    """
+    Render pool task. Returns ((width, height), RGB bytes, render ms) so the
+    page crosses the process boundary as raw pixels, without PNG encoding.
+    """
+    started = time.perf_counter()
+    image = render_page(open_document(pdf_path), page_number, min_side)
+    return image.size, image.tobytes(), round((time.perf_counter() - started) * 1000, 1)
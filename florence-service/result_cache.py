@@ -0,0 +1,130 @@
+"""
+Persistent Florence result cache.
+
+Keyed by SHA-256 of the image bytes + model id + task list, stored in a local
+SQLite file so every Gunicorn worker (and every container restart) shares it.
+Entries are evicted least-recently-used once the stored payload exceeds the
+configured size. Hit/miss counters live in the same file so /health reports
+totals across workers, not per process.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key         TEXT PRIMARY KEY,
+                    value       TEXT    NOT NULL,
+                    size_bytes  INTEGER NOT NULL,
+                    created_at  REAL    NOT NULL,
+                    last_access REAL    NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access);
+                CREATE TABLE IF NOT EXISTS stats (
+                    name  TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+            """)
+
+    def _connect(self):
+        # One connection per thread; Gunicorn threads must not share a sqlite handle
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def file_digest(path):
+        """SHA-256 of a file, read in 1 MB blocks so large PNGs are never held whole."""
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def make_key(digest, model_id, tasks):
+        return f"{digest}:{model_id}:{','.join(tasks)}"
+
+    def get(self, key):
+        """Return the cached result dict, or None. Counts a hit or a miss."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                    return None
+                conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            # A broken cache must never fail an analysis request
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+
+    def put(self, key, result):
+        value = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def _evict(self, conn):
+        """Drop least-recently-used entries until the payload fits in max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        deleted = conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size_bytes) OVER (ORDER BY last_access DESC) AS running
+                    FROM results
+                ) WHERE running > ?
+            )
+        """, (self.max_bytes,)).rowcount
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = 'evictions'", (deleted,))
+
+    def stats(self):
+        try:
+            with self._connect() as conn:
+                counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+                entries, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM results"
+                ).fetchone()
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hitRate": round(counters.get("hits", 0) / lookups, 3) if lookups else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "sizeBytes": size,
+            "maxBytes": self.max_bytes
+        }
@@ -0,0 +1,28 @@
+-- Migration 003: cross-session extraction cache for Workflow A
+-- Workflow A looks up (file_hash, extractor_version) before running any extractor
+-- and stores successful results after responding. Rows idle longer than
+-- EXTRACTION_CACHE_TTL_DAYS are deleted, and least-recently-used rows are evicted
+-- once the cache exceeds EXTRACTION_CACHE_MAX_MB (both enforced by the store query).
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/003_extraction_cache.sql
+
+create table if not exists extraction_cache
+(
+    file_hash         varchar(64)  not null,
+    extractor_version varchar(50)  not null,
+    file_extension    varchar(20),
+    original_filename varchar(500),
+    result            jsonb        not null,
+    size_bytes        bigint       not null,
+    hit_count         integer   default 0,
+    created_at        timestamp default now(),
+    last_accessed_at  timestamp default now(),
+    primary key (file_hash, extractor_version)
+);
+
+alter table extraction_cache
+    owner to n8n;
+
+create index if not exists idx_extraction_cache_last_accessed
+    on extraction_cache (last_accessed_at);
@@ -0,0 +1,28 @@
+-- Migration 004: chunk-level record of each ingested standard for Workflow B
+-- kb_ingest.py derives Qdrant point ids from the chunk's content hash, so a
+-- revised standard only re-embeds the chunks that changed. Workflow B records
+-- the chunk hashes and point ids of the revision it just ingested here, and
+-- removes the kb_standards rows of older revisions of the same standard
+-- (same standard_name and domain_id), which cascades to their chunk rows.
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/004_kb_standard_chunks.sql
+
+create table if not exists kb_standard_chunks
+(
+    standard_id integer     not null
+        references kb_standards
+            on delete cascade,
+    chunk_hash  varchar(64) not null,
+    point_id    uuid        not null,
+    chunk_index integer,
+    token_count integer,
+    page_number integer,
+    primary key (standard_id, chunk_hash)
+);
+
+alter table kb_standard_chunks
+    owner to n8n;
+
+create index if not exists idx_kb_standards_name_domain
+    on kb_standards (standard_name, domain_id);
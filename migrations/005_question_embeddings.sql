@@ -0,0 +1,46 @@
+-- Migration 005: precomputed audit question embeddings for Workflow C2
+-- The question catalogue is fixed, so each question's query vector is embedded
+-- once and stored here instead of calling Ollama on every audit. Rows are keyed
+-- by question and embedding model and only used while text_hash still matches
+-- the question's current text (question_embedding_hash), so editing
+-- question_text / prompt_instructions or switching models invalidates them.
+--
+-- Fill or refresh the table in bulk:
+--   curl -s "$BASE/webhook/admin/db?op=warm_question_embeddings"
+-- C2 also writes back any vector it had to compute during an audit.
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/005_question_embeddings.sql
+
+-- The text C2 embeds for a question; keep in sync with the scheduler's embed() call
+create or replace function question_embedding_text(question_text text, prompt_instructions text)
+    returns text
+    language sql
+    immutable
+as
+$$
+select question_text || E'\n\n' || coalesce(prompt_instructions, '')
+$$;
+
+create or replace function question_embedding_hash(question_text text, prompt_instructions text)
+    returns varchar(64)
+    language sql
+    immutable
+as
+$$
+select encode(sha256(convert_to(question_embedding_text(question_text, prompt_instructions), 'UTF8')), 'hex')
+$$;
+
+create table if not exists question_embeddings
+(
+    question_id uuid         not null,
+    model       varchar(100) not null,
+    text_hash   varchar(64)  not null,
+    dimensions  integer      not null,
+    embedding   jsonb        not null,
+    created_at  timestamp default now(),
+    primary key (question_id, model)
+);
+
+alter table question_embeddings
+    owner to n8n;
@@ -0,0 +1,46 @@
+-- Migration 006: evaluation cache for Workflow C2
+-- Replaces the master-cache lookup that joined audit_logs to audit_evidence and
+-- grouped by session (slower with every audit, and it also matched sessions whose
+-- evidence was a superset of the current files). Rows are keyed by question,
+-- a digest of the sorted set of evidence file hashes and the evaluation version
+-- (model + prompt, EVAL_VERSION in Split by Question), so a lookup is a single
+-- primary-key probe. Log Evaluation Result stores fresh evaluations; once per job
+-- Evict Evaluation Cache drops rows idle longer than EVALUATION_CACHE_TTL_DAYS, then
+-- least-recently-used rows once the cache exceeds EVALUATION_CACHE_MAX_MB. evaluation_cache_stats counts
+-- lookups and hits per day:
+--   select day, lookups, hits, round(100.0 * hits / lookups, 1) as hit_pct
+--   from evaluation_cache_stats order by day desc;
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/006_evaluation_cache.sql
+
+create table if not exists evaluation_cache
+(
+    question_id      uuid         not null,
+    evidence_digest  varchar(64)  not null,
+    eval_version     varchar(100) not null,
+    ai_response      jsonb        not null,
+    session_id       uuid,
+    size_bytes       integer      not null,
+    hit_count        integer   default 0,
+    created_at       timestamp default now(),
+    last_accessed_at timestamp default now(),
+    primary key (question_id, evidence_digest, eval_version)
+);
+
+alter table evaluation_cache
+    owner to n8n;
+
+create index if not exists idx_evaluation_cache_last_accessed
+    on evaluation_cache (last_accessed_at);
+
+create table if not exists evaluation_cache_stats
+(
+    day     date   not null
+        primary key,
+    lookups bigint not null default 0,
+    hits    bigint not null default 0
+);
+
+alter table evaluation_cache_stats
+    owner to n8n;
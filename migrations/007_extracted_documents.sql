@@ -0,0 +1,48 @@
+-- Migration 007: content-addressed store for extracted evidence documents
+-- audit_evidence used to keep a full extracted_data JSONB copy per
+-- (session, question, file), so one PDF attached to 20 questions was stored 20
+-- times per session. Extraction results now live once per (file_hash,
+-- extractor_version) in extracted_documents, LZ4-compressed, and audit_evidence
+-- rows only reference them. Existing rows are moved over with extractor_version
+-- 'legacy'.
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/007_extracted_documents.sql
+-- Then reclaim the space of the old copies (locks audit_evidence while it runs):
+--   docker exec -i compliance-db psql -U n8n -d compliance_db -c 'VACUUM FULL audit_evidence'
+
+create table if not exists extracted_documents
+(
+    file_hash         varchar(64) not null,
+    extractor_version varchar(50) not null,
+    data              jsonb       not null,
+    size_bytes        bigint      not null,
+    created_at        timestamp default now(),
+    primary key (file_hash, extractor_version)
+);
+
+alter table extracted_documents
+    owner to n8n;
+
+alter table extracted_documents
+    alter column data set compression lz4;
+
+alter table audit_evidence
+    add column if not exists extractor_version varchar(50);
+
+alter table audit_evidence
+    alter column extracted_data drop not null;
+
+insert into extracted_documents (file_hash, extractor_version, data, size_bytes)
+select distinct on (file_hash) file_hash, 'legacy', extracted_data, octet_length(extracted_data::text)
+from audit_evidence
+where extracted_data is not null
+  and file_hash is not null
+order by file_hash, created_at desc
+on conflict (file_hash, extractor_version) do nothing;
+
+update audit_evidence
+set extractor_version = 'legacy',
+    extracted_data    = null
+where extracted_data is not null
+  and file_hash is not null;
@@ -0,0 +1,19 @@
+-- Migration 008: throttle for cache eviction sweeps
+-- The TTL delete and the size-budget LRU sweep of extraction_cache (and
+-- evaluation_cache) scan and sort the whole table, so they no longer run on
+-- every store. A sweep first claims its cache's row here; the claim only
+-- succeeds when the last sweep is older than CACHE_EVICT_INTERVAL_MIN, so one
+-- request per interval (across all executions) pays for eviction.
+--
+-- Apply:
+--   docker exec -i compliance-db psql -U n8n -d compliance_db < migrations/008_cache_maintenance.sql
+
+create table if not exists cache_maintenance
+(
+    cache_name      varchar(50) not null
+        primary key,
+    last_evicted_at timestamp   not null default now()
+);
+
+alter table cache_maintenance
+    owner to n8n;
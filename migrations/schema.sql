@@ -134,17 +134,18 @@ create index idx_logs_timestamp
 -- auto-generated definition
 create table audit_evidence
 (
-    id              serial
+    id                serial
         primary key,
-    session_id      uuid  not null,
-    question_id     uuid,
-    domain_id       uuid,
-    filename        varchar(500),
-    file_hash       varchar(64),
-    file_size_bytes bigint,
-    evidence_order  integer   default 1,
-    extracted_data  jsonb not null,
-    created_at      timestamp default now(),
+    session_id        uuid not null,
+    question_id       uuid,
+    domain_id         uuid,
+    filename          varchar(500),
+    file_hash         varchar(64),
+    file_size_bytes   bigint,
+    evidence_order    integer   default 1,
+    extracted_data    jsonb,
+    created_at        timestamp default now(),
+    extractor_version varchar(50),
     constraint unique_evidence_per_session
         unique (session_id, question_id, file_hash)
 );
@@ -177,3 +178,142 @@ create table audit_domains
 alter table audit_domains
     owner to n8n;
 
+
+-- auto-generated definition
+create table extraction_cache
+(
+    file_hash         varchar(64)  not null,
+    extractor_version varchar(50)  not null,
+    file_extension    varchar(20),
+    original_filename varchar(500),
+    result            jsonb        not null,
+    size_bytes        bigint       not null,
+    hit_count         integer   default 0,
+    created_at        timestamp default now(),
+    last_accessed_at  timestamp default now(),
+    primary key (file_hash, extractor_version)
+);
+
+alter table extraction_cache
+    owner to n8n;
+
+create index idx_extraction_cache_last_accessed
+    on extraction_cache (last_accessed_at);
+
+
+-- auto-generated definition
+create table kb_standard_chunks
+(
+    standard_id integer     not null
+        references kb_standards
+            on delete cascade,
+    chunk_hash  varchar(64) not null,
+    point_id    uuid        not null,
+    chunk_index integer,
+    token_count integer,
+    page_number integer,
+    primary key (standard_id, chunk_hash)
+);
+
+alter table kb_standard_chunks
+    owner to n8n;
+
+create index idx_kb_standards_name_domain
+    on kb_standards (standard_name, domain_id);
+
+
+create function question_embedding_text(question_text text, prompt_instructions text) returns text
+    immutable
+    language sql
+as
+$$
+select question_text || E'\n\n' || coalesce(prompt_instructions, '')
+$$;
+
+alter function question_embedding_text(text, text) owner to n8n;
+
+create function question_embedding_hash(question_text text, prompt_instructions text) returns varchar(64)
+    immutable
+    language sql
+as
+$$
+select encode(sha256(convert_to(question_embedding_text(question_text, prompt_instructions), 'UTF8')), 'hex')
+$$;
+
+alter function question_embedding_hash(text, text) owner to n8n;
+
+-- auto-generated definition
+create table question_embeddings
+(
+    question_id uuid         not null,
+    model       varchar(100) not null,
+    text_hash   varchar(64)  not null,
+    dimensions  integer      not null,
+    embedding   jsonb        not null,
+    created_at  timestamp default now(),
+    primary key (question_id, model)
+);
+
+alter table question_embeddings
+    owner to n8n;
+
+
+-- auto-generated definition
+create table evaluation_cache
+(
+    question_id      uuid         not null,
+    evidence_digest  varchar(64)  not null,
+    eval_version     varchar(100) not null,
+    ai_response      jsonb        not null,
+    session_id       uuid,
+    size_bytes       integer      not null,
+    hit_count        integer   default 0,
+    created_at       timestamp default now(),
+    last_accessed_at timestamp default now(),
+    primary key (question_id, evidence_digest, eval_version)
+);
+
+alter table evaluation_cache
+    owner to n8n;
+
+create index idx_evaluation_cache_last_accessed
+    on evaluation_cache (last_accessed_at);
+
+-- auto-generated definition
+create table evaluation_cache_stats
+(
+    day     date   not null
+        primary key,
+    lookups bigint not null default 0,
+    hits    bigint not null default 0
+);
+
+alter table evaluation_cache_stats
+    owner to n8n;
+
+
+-- auto-generated definition
+create table extracted_documents
+(
+    file_hash         varchar(64) not null,
+    extractor_version varchar(50) not null,
+    data              jsonb       not null compression lz4,
+    size_bytes        bigint      not null,
+    created_at        timestamp default now(),
+    primary key (file_hash, extractor_version)
+);
+
+alter table extracted_documents
+    owner to n8n;
+
+
+-- auto-generated definition
+create table cache_maintenance
+(
+    cache_name      varchar(50) not null
+        primary key,
+    last_evicted_at timestamp   not null default now()
+);
+
+alter table cache_maintenance
+    owner to n8n;
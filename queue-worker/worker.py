@@ -0,0 +1,298 @@
+"""
+Audit queue worker.
+
+Takes over the dequeue side of Workflow C2. Instead of a 10-second cron doing a
+single non-blocking RPOP, each consumer thread blocks on BLMOVE, which moves the
+next job from audit_job_queue into that consumer's own processing list. The
+consumer then hands the job to Workflow C2 through its webhook and waits for the
+execution to finish before acknowledging the job (LREM from the processing
+list). Jobs start as soon as they are pushed, and throughput scales with
+QUEUE_CONCURRENCY and with the number of worker containers.
+
+Crash safety (at-least-once delivery):
+  * Every consumer owns a heartbeat key with a TTL of QUEUE_VISIBILITY_TIMEOUT
+    seconds. A background thread refreshes the keys while the process is alive.
+  * A reaper in every worker process scans the processing lists. Jobs whose
+    consumer stopped heartbeating go back to the front of the queue.
+  * A job that fails dispatch or is reclaimed QUEUE_MAX_ATTEMPTS times moves to
+    the dead-letter list (audit_job_queue:dead) with the last error.
+
+Redis keys (QUEUE_KEY defaults to audit_job_queue, matching Workflow C1's push):
+  <queue>                           pending jobs (C1 LPUSHes, consumers take from the right)
+  <queue>:processing:<consumer>     jobs in flight for one consumer
+  <queue>:heartbeat:<consumer>      liveness key, expires after the visibility timeout
+  <queue>:attempts                  hash jobId → failed attempts so far
+  <queue>:dead                      dead-lettered jobs (JSON with error, attempts, payload)
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+import redis
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(threadName)s] %(message)s")
+logger = logging.getLogger("queue-worker")
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+QUEUE_KEY = os.environ.get("AUDIT_QUEUE_KEY", "audit_job_queue")
+
+# Concurrent jobs per worker container; scale containers for more
+CONCURRENCY = max(1, int(os.environ.get("QUEUE_CONCURRENCY", "2")))
+# Seconds without a heartbeat before a consumer's in-flight jobs are requeued
+VISIBILITY_TIMEOUT = max(10, int(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", "60")))
+MAX_ATTEMPTS = max(1, int(os.environ.get("QUEUE_MAX_ATTEMPTS", "3")))
+REAP_INTERVAL = max(1, int(os.environ.get("QUEUE_REAP_INTERVAL", "15")))
+# BLMOVE block time; only bounds how quickly a consumer notices shutdown
+BLOCK_TIMEOUT = 5
+
+# Workflow C2 webhook. It answers when the execution finishes (responseMode: lastNode),
+# so the request timeout must cover a whole audit (EXECUTIONS_TIMEOUT_MAX in n8n).
+WORKER_WEBHOOK = os.environ.get("AUDIT_WORKER_WEBHOOK", "http://n8n:5678/webhook/audit/worker")
+WEBHOOK_API_KEY = os.environ.get("WEBHOOK_API_KEY", "")
+JOB_TIMEOUT = int(os.environ.get("QUEUE_JOB_TIMEOUT", "7200"))
+
+PROCESSING_PREFIX = f"{QUEUE_KEY}:processing:"
+HEARTBEAT_PREFIX = f"{QUEUE_KEY}:heartbeat:"
+ATTEMPTS_KEY = f"{QUEUE_KEY}:attempts"
+DEAD_KEY = f"{QUEUE_KEY}:dead"
+
+# Requeue one in-flight job, or dead-letter it once it has used up its attempts.
+# Atomic so concurrent reapers and the owning consumer never double-move a job.
+#   KEYS: processing list, queue, attempts hash, dead-letter list
+#   ARGV: payload, job id, session id, max attempts, error, timestamp, "front" | "back"
+# Returns -1 if the job was no longer in flight, 0 if dead-lettered, else attempts so far.
+RELEASE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+  return -1
+end
+local attempts = redis.call('HINCRBY', KEYS[3], ARGV[2], 1)
+if attempts >= tonumber(ARGV[4]) then
+  redis.call('HDEL', KEYS[3], ARGV[2])
+  redis.call('LPUSH', KEYS[4], cjson.encode({
+    jobId = ARGV[2],
+    sessionId = ARGV[3],
+    attempts = attempts,
+    error = ARGV[5],
+    failedAt = ARGV[6],
+    payload = ARGV[1]
+  }))
+  return 0
+end
+if ARGV[7] == 'front' then
+  redis.call('RPUSH', KEYS[2], ARGV[1])
+else
+  redis.call('LPUSH', KEYS[2], ARGV[1])
+end
+return attempts
+"""
+
+
+class DispatchError(Exception):
+    pass
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def job_fields(payload):
+    """The decoded job, or {} if the payload is not a JSON object."""
+    try:
+        job = json.loads(payload)
+    except ValueError:
+        return {}
+    return job if isinstance(job, dict) else {}
+
+
+def job_id(payload, job):
+    """C1's jobId, or a digest of the payload so malformed entries are still tracked."""
+    if isinstance(job.get("jobId"), str):
+        return job["jobId"]
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def queue_wait_seconds(job):
+    try:
+        created = datetime.fromisoformat(job["createdAt"].replace("Z", "+00:00"))
+    except (KeyError, AttributeError, ValueError):
+        return None
+    return max(0.0, (datetime.now(timezone.utc) - created).total_seconds())
+
+
+def dispatch(payload):
+    """POST the job to Workflow C2 and wait for the execution to finish."""
+    req = urllib.request.Request(
+        WORKER_WEBHOOK,
+        data=payload.encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-API-Key": WEBHOOK_API_KEY},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=JOB_TIMEOUT) as resp:
+            resp.read()
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8", "replace")[:300]
+        raise DispatchError(f"Workflow C2 returned HTTP {e.code}: {detail}")
+    except (OSError, http.client.HTTPException) as e:  # URLError, resets, timeouts, bad responses
+        raise DispatchError(f"Workflow C2 request failed: {e!r}")
+
+
+class Worker:
+    def __init__(self):
+        self.redis = redis.Redis(
+            host=REDIS_HOST, port=REDIS_PORT, decode_responses=True,
+            socket_timeout=BLOCK_TIMEOUT + 10, health_check_interval=30
+        )
+        self.release = self.redis.register_script(RELEASE_SCRIPT)
+        self.stopping = threading.Event()
+        self.consumers_done = threading.Event()
+        # Stable across container restarts, so a restarted worker reclaims its own lists
+        host = socket.gethostname()
+        self.consumers = [f"{host}-{i}" for i in range(CONCURRENCY)]
+
+    # ── Job lifecycle ──────────────────────────────────────────────────────────
+
+    def release_job(self, processing_key, payload, error, end, max_attempts=MAX_ATTEMPTS):
+        job = job_fields(payload)
+        jid, session_id = job_id(payload, job), str(job.get("sessionId") or "")
+        attempts = self.release(
+            keys=[processing_key, QUEUE_KEY, ATTEMPTS_KEY, DEAD_KEY],
+            args=[payload, jid, session_id, max_attempts, error, utc_now(), end]
+        )
+        if attempts == 0:
+            logger.error(f"Dead-lettered job {jid} (session {session_id or '-'}): {error}")
+        elif attempts > 0:
+            logger.warning(f"Requeued job {jid} (attempt {attempts}/{max_attempts}): {error}")
+
+    def ack(self, processing_key, payload):
+        with self.redis.pipeline() as pipe:
+            pipe.lrem(processing_key, 1, payload)
+            pipe.hdel(ATTEMPTS_KEY, job_id(payload, job_fields(payload)))
+            pipe.execute()
+
+    def handle(self, processing_key, payload):
+        job = job_fields(payload)
+        if not job.get("sessionId"):
+            # Retrying a payload that is not a job cannot succeed
+            self.release_job(processing_key, payload, "Payload is not a valid audit job", "back", max_attempts=1)
+            return
+
+        wait = queue_wait_seconds(job)
+        logger.info(f"Job {job.get('jobId')} session {job['sessionId']} started"
+                    + (f" after {wait:.2f}s in queue" if wait is not None else ""))
+        started = time.monotonic()
+        try:
+            dispatch(payload)
+        except DispatchError as e:
+            self.release_job(processing_key, payload, str(e), "back")
+            return
+        self.ack(processing_key, payload)
+        logger.info(f"Job {job.get('jobId')} finished in {time.monotonic() - started:.1f}s")
+
+    # ── Threads ────────────────────────────────────────────────────────────────
+
+    def requeue_own(self, processing_key, error):
+        for payload in self.redis.lrange(processing_key, 0, -1):
+            self.release_job(processing_key, payload, error, "front")
+
+    def consume(self, consumer):
+        processing_key = PROCESSING_PREFIX + consumer
+        # Jobs in our own list while we are between jobs are not being worked on: left by a
+        # previous run, or stranded by an error below. Our heartbeat keeps the reaper away
+        # from them, so the consumer requeues them itself.
+        stranded = "Worker restarted while job was in flight"
+
+        while not self.stopping.is_set():
+            try:
+                if stranded:
+                    self.requeue_own(processing_key, stranded)
+                    stranded = None
+                payload = self.redis.blmove(QUEUE_KEY, processing_key, BLOCK_TIMEOUT, "RIGHT", "LEFT")
+                if payload is None:
+                    continue
+                try:
+                    self.handle(processing_key, payload)
+                except redis.RedisError:
+                    raise
+                except Exception as e:
+                    logger.exception(f"Consumer {consumer} failed handling a job")
+                    self.release_job(processing_key, payload, f"Worker error: {e!r}", "back")
+            except redis.RedisError as e:
+                logger.warning(f"Redis error in consumer {consumer}: {e}")
+                stranded = f"Consumer {consumer} hit a Redis error while job was in flight"
+                self.stopping.wait(2)
+            except Exception as e:
+                logger.exception(f"Unexpected error in consumer {consumer}")
+                stranded = f"Worker error: {e!r}"
+                self.stopping.wait(2)
+
+    def beat(self):
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for consumer in self.consumers:
+                    pipe.set(HEARTBEAT_PREFIX + consumer, utc_now(), ex=VISIBILITY_TIMEOUT)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Heartbeat failed: {e}")
+
+    def heartbeat(self):
+        # Keeps beating after stop() until the consumers have finished their in-flight jobs
+        while not self.consumers_done.wait(VISIBILITY_TIMEOUT / 3):
+            self.beat()
+
+    def reap(self):
+        """Requeue jobs held by consumers (in any container) whose heartbeat expired."""
+        while not self.stopping.wait(REAP_INTERVAL):
+            try:
+                for processing_key in self.redis.scan_iter(match=PROCESSING_PREFIX + "*", count=100):
+                    consumer = processing_key[len(PROCESSING_PREFIX):]
+                    if self.redis.exists(HEARTBEAT_PREFIX + consumer):
+                        continue
+                    for payload in self.redis.lrange(processing_key, 0, -1):
+                        self.release_job(processing_key, payload,
+                                         f"Consumer {consumer} stopped heartbeating", "front")
+            except redis.RedisError as e:
+                logger.warning(f"Reaper failed: {e}")
+
+    def run(self):
+        logger.info(f"Consuming {QUEUE_KEY} on {REDIS_HOST}:{REDIS_PORT} with {CONCURRENCY} consumer(s) → {WORKER_WEBHOOK}")
+        # Publish heartbeats before the first BLMOVE so the reaper never sees a fresh job unowned
+        self.beat()
+        heartbeat = threading.Thread(target=self.heartbeat, name="heartbeat", daemon=True)
+        heartbeat.start()
+        threading.Thread(target=self.reap, name="reaper", daemon=True).start()
+        consumers = [
+            threading.Thread(target=self.consume, args=(consumer,), name=consumer)
+            for consumer in self.consumers
+        ]
+        for thread in consumers:
+            thread.start()
+        for thread in consumers:
+            thread.join()
+        self.consumers_done.set()
+        heartbeat.join()
+        self.redis.delete(*[HEARTBEAT_PREFIX + consumer for consumer in self.consumers])
+
+    def stop(self, *_):
+        # In-flight jobs keep running; whatever is still in a processing list when the
+        # container dies is reclaimed on restart or by another worker's reaper.
+        logger.info("Shutting down after in-flight jobs finish")
+        self.stopping.set()
+
+
+if __name__ == "__main__":
+    worker = Worker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
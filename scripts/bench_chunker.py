@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for chunker.py
+========================
+Chunks a Workflow A extraction result with the token-aware chunker and with
+the old Workflow B word window (1000 words, 200 overlap), then reports
+throughput, how many embeddings each produces, and how many tokens the word
+window loses to nomic-embed-text's 2048-token truncation.
+
+    python3 scripts/bench_chunker.py                        # bundled questionnaire
+    python3 scripts/bench_chunker.py --input extracted.json --repeat 20
+
+The default input is temp-assets/Compliance Questionnaire_DI Inputs.xlsx run
+through excel_extractor.py in-process (needs pandas + openpyxl). Token counts
+are exact when CHUNKER_TOKENIZER points at a tokenizer.json and `tokenizers`
+is installed, otherwise estimated (see chunker.py).
+Exit codes:
+  0 — every token-aware chunk fits the embedding window
+  1 — a chunk would be truncated, or the input could not be loaded
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import chunker  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONNAIRE = os.path.join(REPO_ROOT, "temp-assets", "Compliance Questionnaire_DI Inputs.xlsx")
+WINDOW = chunker.EMBED_WINDOW - chunker.SPECIAL_TOKENS
+
+
+# ── Reference implementation (Workflow B "Chunk Text" node) ───────────────────
+
+def legacy_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> list:
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = " ".join(words[i:i + chunk_size])
+        if len(chunk.strip()) > 50:
+            chunks.append(chunk)
+    return chunks
+
+
+# ── Input ─────────────────────────────────────────────────────────────────────
+
+def load_questionnaire() -> dict:
+    import excel_extractor as xl
+    xl.import_dependencies()
+    out = io.StringIO()
+    os.environ.setdefault("EXCEL_DAEMON", "off")
+    xl.extract(QUESTIONNAIRE, os.path.basename(QUESTIONNAIRE), out)
+    return json.loads(out.getvalue())
+
+
+def timed(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeat
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="Workflow A extraction JSON (default: bundled questionnaire)")
+    parser.add_argument("--repeat", type=int, default=10, help="chunking runs to average (default 10)")
+    parser.add_argument("--max-tokens", type=int, default=chunker.MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=chunker.OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    try:
+        if args.input:
+            with open(args.input, encoding="utf-8") as f:
+                extracted = json.load(f)
+        else:
+            extracted = load_questionnaire()
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Cannot load input: {e}")
+        return 1
+
+    counter = chunker.default_counter()
+    text = extracted.get("fullDocument") or ""
+    pages = chunker.document_pages(extracted)
+    source_tokens = sum(counter.count_many([p["text"] for p in pages]))
+
+    chunks, new_s = timed(lambda: chunker.chunk_document(extracted, args.max_tokens, args.overlap, counter), args.repeat)
+    old, old_s = timed(lambda: legacy_chunks(text), args.repeat)
+
+    new_tokens = [c["tokenCount"] for c in chunks]
+    old_tokens = counter.count_many(old)
+    old_lost = sum(max(0, t - WINDOW) for t in old_tokens)
+    oversized = [t for t in new_tokens if t > WINDOW]
+
+    print(f"input        {len(pages)} page(s)/sheet(s), {len(text) / 1e6:.2f} MB text, {source_tokens} tokens "
+          f"({'exact' if counter.exact else 'estimated'})")
+    print(f"{'':12} {'chunks':>7} {'tokens':>8} {'max':>6} {'truncated':>9} {'lost tok':>9} {'ms/doc':>8} {'chunks/s':>9}")
+    print(f"{'token-aware':12} {len(chunks):7} {sum(new_tokens):8} {max(new_tokens, default=0):6} "
+          f"{len(oversized):9} {sum(t - WINDOW for t in oversized):9} {new_s * 1000:8.1f} {len(chunks) / new_s if new_s else 0:9.0f}")
+    print(f"{'word window':12} {len(old):7} {sum(old_tokens):8} {max(old_tokens, default=0):6} "
+          f"{sum(1 for t in old_tokens if t > WINDOW):9} {old_lost:9} {old_s * 1000:8.1f} {len(old) / old_s if old_s else 0:9.0f}")
+
+    sheets = sorted({c["sheetName"] for c in chunks if c["sheetName"]})
+    if sheets:
+        print(f"sheets       {', '.join(sheets)}")
+    return 1 if oversized else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for excel_extractor.py header detection
+==================================================
+Times count_dense_rows + find_header_row on synthetic questionnaire-shaped
+sheets (title rows, a header, then data with blank and sparse rows) and checks
+the result against the original quadratic implementation.
+
+    python3 scripts/bench_excel_extractor.py                  # 10k / 100k / 500k rows
+    python3 scripts/bench_excel_extractor.py --rows 20000 --legacy-max 20000
+
+The legacy scorer is O(rows²), so it only runs on sizes up to --legacy-max.
+Exit codes:
+  0 — all results match and the speedup is at least --min-speedup
+  1 — header/dense-row mismatch or speedup below --min-speedup
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import excel_extractor as xl  # noqa: E402
+
+xl.import_dependencies()
+
+
+# ── Reference implementation (pre-suffix-count) ───────────────────────────────
+
+def legacy_count_dense_rows(matrix) -> int:
+    return sum(
+        1 for row in matrix
+        if sum(1 for v in row if xl.is_filled(v)) >= xl.MIN_FILLED_CELLS
+    )
+
+
+def legacy_find_header_row(matrix) -> int | None:
+    best_idx, best_score = None, 0
+    for i, row in enumerate(matrix):
+        filled = [v for v in row if xl.is_filled(v)]
+        if len(filled) < xl.MIN_FILLED_CELLS:
+            continue
+        avg_len = sum(len(str(v)) for v in filled) / len(filled)
+        if avg_len >= xl.MAX_AVG_HEADER_LEN:
+            continue
+        unique_vals = set(str(v).strip() for v in filled)
+        if len(unique_vals) / len(filled) < xl.MIN_UNIQUE_RATIO:
+            continue
+        dense_below = sum(
+            1 for j in range(i + 1, len(matrix))
+            if sum(1 for v in matrix[j] if xl.is_filled(v)) >= xl.MIN_FILLED_CELLS
+        )
+        score = len(unique_vals) * dense_below
+        if score > best_score:
+            best_score = score
+            best_idx = i
+    return best_idx if best_score > 0 else None
+
+
+# ── Synthetic sheets ──────────────────────────────────────────────────────────
+
+def synthetic_sheet(n_rows: int, n_cols: int = 8) -> list:
+    header = ["Domain", "Control ID", "Question", "Response", "Evidence", "Owner", "Status", "Notes"][:n_cols]
+    matrix = [
+        ["Compliance Questionnaire"] + [None] * (n_cols - 1),
+        [None] * n_cols,
+        header + [None] * (n_cols - len(header)),
+    ]
+    statuses = ["Compliant", "Partial", "Gap", None]
+    for i in range(n_rows):
+        if i % 50 == 0:
+            matrix.append([None] * n_cols)                              # blank separator
+        elif i % 17 == 0:
+            matrix.append([f"Section {i}"] + [None] * (n_cols - 1))     # sparse section row
+        else:
+            row = [f"D{i % 12}", f"C-{i}", f"Is control {i} implemented?", "Yes" if i % 3 else "No",
+                   f"doc_{i % 40}.pdf", f"owner{i % 9}", statuses[i % 4], None if i % 5 else "see policy"]
+            matrix.append(row[:n_cols])
+    return matrix
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--legacy-max", type=int, default=2_000,
+                        help="largest sheet the quadratic reference is run on (default 2000)")
+    parser.add_argument("--min-speedup", type=float, default=5.0,
+                        help="fail if the new scorer is not this much faster than legacy (default 5)")
+    args = parser.parse_args()
+
+    sizes = sorted(set(args.rows + [min(args.legacy_max, min(args.rows))]))
+    ok = True
+
+    print(f"{'rows':>9}  {'new (s)':>9}  {'legacy (s)':>10}  {'speedup':>8}  header  dense")
+    for n_rows in sizes:
+        matrix = synthetic_sheet(n_rows)
+
+        def new_path(m):
+            counts = xl.row_filled_counts(m)
+            return xl.count_dense_rows(m, counts), xl.find_header_row(m, counts)
+
+        (dense, header), new_s = timed(new_path, matrix)
+
+        legacy_col, speedup_col = "-", "-"
+        if n_rows <= args.legacy_max:
+            def legacy_path(m):
+                return legacy_count_dense_rows(m), legacy_find_header_row(m)
+
+            (legacy_dense, legacy_header), legacy_s = timed(legacy_path, matrix)
+            speedup = legacy_s / new_s if new_s else float("inf")
+            legacy_col, speedup_col = f"{legacy_s:10.3f}", f"{speedup:7.1f}x"
+            if (dense, header) != (legacy_dense, legacy_header):
+                print(f"MISMATCH at {n_rows} rows: new={(dense, header)} legacy={(legacy_dense, legacy_header)}")
+                ok = False
+            if speedup < args.min_speedup:
+                print(f"SLOW at {n_rows} rows: speedup {speedup:.1f}x < {args.min_speedup}x")
+                ok = False
+
+        print(f"{n_rows:>9}  {new_s:9.3f}  {legacy_col:>10}  {speedup_col:>8}  {header!s:>6}  {dense}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Structure-aware chunker shared by KB ingestion (kb_ingest.py) and evidence
+retrieval (Workflow C2)
+==========================================================================
+Chunks a Workflow A extraction result by real token counts instead of word
+windows, so every chunk fits nomic-embed-text's 2048-token window and nothing
+is silently truncated at embedding time.
+
+  * Works from the per-page `pages` array (falls back to `fullDocument`).
+  * Sheets are hard boundaries; continuation chunks of a sheet repeat its
+    header row so table rows keep their column names.
+  * Headings start a new chunk once the current one is reasonably full, and
+    the active heading is recorded on every chunk.
+  * Pages are packed together up to the budget, but a paragraph never
+    straddles two pages; chunks record pageNumber (first) and pageEnd.
+  * Oversized paragraphs are split on sentences, then on exact token offsets.
+  * Boundaries are content-defined: past 70% of the budget, a chunk closes after
+    an "anchor" paragraph picked by a hash of its text. An edit therefore only
+    changes the chunks around it, and the chunking re-synchronises at the next
+    anchor, which keeps incremental re-ingestion (kb_ingest.py) proportional
+    to what changed.
+
+Token counts come from the Hugging Face `tokenizers` library loading
+CHUNKER_TOKENIZER (nomic-embed-text's tokenizer.json). Without it a
+conservative estimate is used: it over-counts WordPiece tokens, so chunks come
+out smaller but still never overflow the window.
+
+Used as a module:
+    from chunker import chunk_document
+    chunks = chunk_document(extracted, max_tokens=1900, overlap_tokens=64)
+
+Or as a filter (Workflow C2 evidence indexing):
+    python3 /scripts/chunker.py [--max-tokens N] [--overlap N] [extracted.json] < extracted.json
+
+Outputs a JSON array:
+[
+  {
+    "text":        "<chunk text>",
+    "chunkIndex":  0,
+    "tokenCount":  <int>,
+    "pageNumber":  <int | null>,
+    "pageEnd":     <int | null>,
+    "sheetName":   "<sheet>" | null,
+    "heading":     "<nearest heading>" | null
+  }, ...
+]
+
+Exit codes:
+  0 — success (JSON printed to stdout)
+  1 — input missing or not valid JSON
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import zlib
+
+
+# ── Tuning constants ───────────────────────────────────────────────────────────
+EMBED_WINDOW       = 2048   # nomic-embed-text context length (tokens)
+SPECIAL_TOKENS     = 2      # [CLS] + [SEP] added by the model
+# Headroom below the window in case Ollama's GGUF tokenizer splits slightly differently
+MAX_TOKENS         = int(os.environ.get("CHUNK_MAX_TOKENS", "1900"))
+OVERLAP_TOKENS     = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+MIN_FILL_RATIO     = 0.25   # a heading only closes chunks at least this full
+ANCHOR_FILL_RATIO  = 0.7    # an anchor paragraph only closes chunks at least this full
+ANCHOR_SPACING     = 0.25   # expected tokens between anchors, as a fraction of the budget
+MAX_HEADING_CHARS  = 100
+TOKENIZER_PATH     = os.environ.get("CHUNKER_TOKENIZER", "/opt/tokenizers/nomic-embed-text.json")
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+ESTIMATE_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+HEADING_PATTERNS = (
+    re.compile(r"^#{1,6}\s+\S"),                                              # Markdown
+    re.compile(r"^(\d+(\.\d+)*\.?|[A-Z]\.|[IVXLC]+\.)\s+[A-Z]"),              # 1.2 Scope / A. Scope / IV. Scope
+    re.compile(r"^(chapter|section|article|part|annex|appendix)\s+[\w.-]+", re.IGNORECASE),
+)
+
+
+# ── Token counting ────────────────────────────────────────────────────────────
+
+class TokenCounter:
+    """Exact WordPiece counts via `tokenizers` when available, else an over-estimate."""
+
+    def __init__(self, tokenizer_path: str | None = TOKENIZER_PATH):
+        self.tokenizer = None
+        if tokenizer_path and os.path.exists(tokenizer_path):
+            try:
+                from tokenizers import Tokenizer
+                self.tokenizer = Tokenizer.from_file(tokenizer_path)
+                self.tokenizer.no_truncation()
+                self.tokenizer.no_padding()
+            except Exception:
+                self.tokenizer = None
+        # encode_batch_fast (tokenizers >= 0.20) skips offset tracking, which counting does not need
+        self._encode_batch = getattr(self.tokenizer, "encode_batch_fast", None) or getattr(self.tokenizer, "encode_batch", None)
+
+    @property
+    def exact(self) -> bool:
+        return self.tokenizer is not None
+
+    def count_many(self, texts: list) -> list:
+        if not texts:
+            return []
+        if self.tokenizer is not None:
+            return [len(e.ids) for e in self._encode_batch(texts, add_special_tokens=False)]
+        return [self.estimate(t) for t in texts]
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        # Uncased WordPiece: common words are one token, long/rare words split into
+        # ~4-char pieces, digits into short runs, every symbol is its own token
+        total = 0
+        for piece in ESTIMATE_PIECES.findall(text):
+            if piece.isalpha():
+                total += 1 if len(piece) <= 6 else 1 + math.ceil((len(piece) - 6) / 4)
+            elif piece.isdigit():
+                total += math.ceil(len(piece) / 3)
+            else:
+                total += 1
+        return total
+
+    def split(self, text: str, max_tokens: int) -> list:
+        """Cut text into pieces of at most max_tokens tokens."""
+        if self.tokenizer is not None:
+            offsets = self.tokenizer.encode(text, add_special_tokens=False).offsets
+            pieces = []
+            for start in range(0, len(offsets), max_tokens):
+                window = offsets[start:start + max_tokens]
+                end = offsets[start + max_tokens][0] if start + max_tokens < len(offsets) else len(text)
+                pieces.append(text[window[0][0]:end].strip())
+            return [p for p in pieces if p]
+
+        pieces, current, used = [], [], 0
+        for word in text.split():
+            cost = self.estimate(word)
+            if current and used + cost > max_tokens:
+                pieces.append(" ".join(current))
+                current, used = [], 0
+            current.append(word)
+            used += cost
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+
+_default_counter = None
+
+
+def default_counter() -> TokenCounter:
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+
+# ── Structure ─────────────────────────────────────────────────────────────────
+
+def is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS or line.endswith((".", ",", ";")):
+        return False
+    if any(p.match(line) for p in HEADING_PATTERNS):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 4 and all(c.isupper() for c in letters)
+
+
+def page_blocks(text: str) -> list:
+    """Paragraphs of a text page as (kind, text); headings are blocks of their own."""
+    blocks, paragraph = [], []
+
+    def close():
+        if paragraph:
+            blocks.append(("text", " ".join(paragraph)))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            close()
+        elif is_heading(stripped):
+            close()
+            blocks.append(("heading", stripped.lstrip("#").strip()))
+        else:
+            paragraph.append(stripped)
+    close()
+    return blocks
+
+
+def document_pages(extracted: dict) -> list:
+    pages = [p for p in (extracted.get("pages") or []) if isinstance(p, dict) and (p.get("text") or "").strip()]
+    if pages:
+        return pages
+    text = extracted.get("fullDocument") or extracted.get("fullText") or extracted.get("text") or ""
+    return [{"pageNumber": None, "text": text}] if text.strip() else []
+
+
+# ── Chunking ──────────────────────────────────────────────────────────────────
+
+class _Builder:
+    def __init__(self, max_tokens: int, overlap_tokens: int):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.chunks = []
+        self.reset()
+        self.heading = None
+
+    def reset(self):
+        self.parts = []          # (text, tokens, pageNumber)
+        self.used = 0
+        self.prefix = None       # (text, tokens) repeated at the top, e.g. a sheet header row
+        self.sheet = None
+        self.joiner = "\n\n"
+        self.chunk_heading = None
+
+    def start(self, sheet=None, joiner="\n\n", prefix=None):
+        self.sheet, self.joiner, self.prefix = sheet, joiner, prefix
+
+    def capacity(self) -> int:
+        return self.max_tokens - (self.prefix[1] if self.prefix else 0)
+
+    def flush(self, carry: bool):
+        if not self.parts:
+            return
+        parts = self.parts
+        if self.prefix and parts[0][0] != self.prefix[0]:
+            parts = [(self.prefix[0], self.prefix[1], parts[0][2])] + parts
+        pages = [p[2] for p in parts if p[2] is not None]
+        self.chunks.append({
+            "text": self.joiner.join(p[0] for p in parts),
+            "chunkIndex": len(self.chunks),
+            "tokenCount": sum(p[1] for p in parts),
+            "pageNumber": pages[0] if pages else None,
+            "pageEnd": pages[-1] if pages else None,
+            "sheetName": self.sheet,
+            "heading": self.chunk_heading
+        })
+
+        kept = []
+        if carry and self.overlap_tokens > 0:
+            budget = self.overlap_tokens
+            for part in reversed(self.parts):
+                if part[1] > budget or (self.prefix and part[0] == self.prefix[0]):
+                    break
+                kept.insert(0, part)
+                budget -= part[1]
+        self.parts = kept
+        self.used = sum(p[1] for p in kept)
+        self.chunk_heading = self.heading
+
+    def add(self, text: str, tokens: int, page):
+        if self.parts and self.used + tokens > self.capacity():
+            self.flush(carry=True)
+            # Carried overlap must not push the new part over the budget
+            while self.parts and self.used + tokens > self.capacity():
+                self.used -= self.parts.pop(0)[1]
+        if not self.parts:
+            self.chunk_heading = self.heading
+        self.parts.append((text, tokens, page))
+        self.used += tokens
+        if self.used >= self.max_tokens * ANCHOR_FILL_RATIO and is_anchor(text, tokens, self.max_tokens):
+            self.flush(carry=True)
+
+
+def is_anchor(text: str, tokens: int, max_tokens: int) -> bool:
+    """Content-defined boundary: about one anchor per ANCHOR_SPACING of the budget."""
+    return zlib.crc32(text.encode("utf-8")) / 0xFFFFFFFF < tokens / (max_tokens * ANCHOR_SPACING)
+
+
+def chunk_document(extracted: dict, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                   counter: TokenCounter | None = None) -> list:
+    """Token-bounded chunks of a Workflow A extraction result (see module docstring)."""
+    counter = counter or default_counter()
+    max_tokens = max(16, min(max_tokens, EMBED_WINDOW - SPECIAL_TOKENS))
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 4))
+    builder = _Builder(max_tokens, overlap_tokens)
+
+    for page in document_pages(extracted):
+        page_number = page.get("pageNumber")
+        sheet = page.get("sheetName")
+
+        if sheet:
+            # Each sheet is its own section: rows are blocks, the first row is the header
+            builder.flush(carry=False)
+            builder.reset()
+            builder.heading = None
+            rows = [r for r in page["text"].splitlines() if r.strip()]
+            counts = counter.count_many(rows)
+            header = (rows[0], counts[0]) if rows and counts[0] <= max_tokens // 4 else None
+            builder.start(sheet=sheet, joiner="\n", prefix=header)
+            for row, tokens in zip(rows, counts):
+                for piece, piece_tokens in _fit(row, tokens, builder.capacity(), counter):
+                    builder.add(piece, piece_tokens, page_number)
+            builder.flush(carry=False)
+            builder.reset()
+            continue
+
+        blocks = page_blocks(page["text"])
+        counts = counter.count_many([b[1] for b in blocks])
+        for (kind, text), tokens in zip(blocks, counts):
+            if kind == "heading":
+                if builder.used >= max_tokens * MIN_FILL_RATIO:
+                    builder.flush(carry=False)
+                builder.heading = text
+                if not builder.parts:
+                    builder.chunk_heading = text
+            for piece, piece_tokens in _fit(text, tokens, max_tokens, counter):
+                builder.add(piece, piece_tokens, page_number)
+
+    builder.flush(carry=False)
+    return builder.chunks
+
+
+def _fit(text: str, tokens: int, max_tokens: int, counter: TokenCounter) -> list:
+    """The block itself, or sentence/token-level pieces of it that fit max_tokens."""
+    if tokens <= max_tokens:
+        return [(text, tokens)]
+    pieces = []
+    sentences = SENTENCE_END.split(text)
+    for sentence, count in zip(sentences, counter.count_many(sentences)):
+        if count <= max_tokens:
+            pieces.append((sentence, count))
+        else:
+            parts = counter.split(sentence, max_tokens)
+            pieces.extend(zip(parts, counter.count_many(parts)))
+    # Re-pack consecutive sentences so oversized paragraphs do not explode into tiny chunks
+    packed = []
+    for sentence, count in pieces:
+        if packed and packed[-1][1] + count <= max_tokens:
+            packed[-1] = (packed[-1][0] + " " + sentence, packed[-1][1] + count)
+        else:
+            packed.append((sentence, count))
+    return packed
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Chunk a Workflow A extraction result.")
+    parser.add_argument("input", nargs="?", help="extraction JSON file (default: stdin)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    try:
+        if args.input:
+            with open(args.input, encoding="utf-8") as f:
+                extracted = json.load(f)
+        else:
+            extracted = json.load(sys.stdin)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"error": f"Cannot read extraction JSON: {e}", "errorCode": "CHUNK_INPUT"}), flush=True)
+        return 1
+
+    chunks = chunk_document(extracted, args.max_tokens, args.overlap)
+    print(json.dumps(chunks, ensure_ascii=False), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
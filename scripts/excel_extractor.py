@@ -7,6 +7,21 @@ Adapted from the Universal Excel Table Extractor.
 Called by n8n's Execute Command node:
     python3 /scripts/excel_extractor.py /tmp/n8n_processing/<prefix>input.xlsx <originalFileName>
 
+Large workbooks (≥ EXCEL_STREAMING_MIN_MB, default 10) are read in read-only
+streaming mode with bounded memory; EXCEL_STREAMING=always|never overrides the
+size check. Both modes produce identical output.
+
+Multi-sheet workbooks of at least EXCEL_PARALLEL_MIN_MB (default 2) have their
+sheets streamed in a process pool (EXCEL_SHEET_WORKERS, default min(4, CPUs);
+1 = serial) and merged back in workbook order.
+
+Daemon mode keeps pandas/openpyxl imported and extracts in a process pool:
+    python3 /scripts/excel_extractor.py --serve
+The CLI above is then a thin client: it sends the request over the Unix socket
+(EXCEL_DAEMON_SOCKET) and prints the daemon's reply. If no daemon answers it
+extracts in-process; with EXCEL_DAEMON=auto (default) it also starts one in the
+background for the next call. EXCEL_DAEMON=off always extracts in-process.
+
 Outputs a single JSON object to stdout matching Workflow A's extraction contract:
 {
   "filePrefix":       "<prefix>",
@@ -40,21 +55,40 @@ Exit codes:
   2 — extraction error (encrypted/corrupt file)
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import json
+import multiprocessing
 import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
-try:
-    import openpyxl
-    import pandas as pd
-except ImportError as e:
-    print(json.dumps({
-        "error": f"Missing dependency: {e}. Run: pip3 install openpyxl pandas",
-        "exitCode": 1
-    }), flush=True)
-    sys.exit(1)
+# Heavy imports are deferred so the thin client starts in milliseconds
+np = openpyxl = pd = None
+
+
+def import_dependencies() -> None:
+    global np, openpyxl, pd
+    try:
+        import numpy as np
+        import openpyxl
+        import pandas as pd
+    except ImportError as e:
+        print(json.dumps({
+            "error": f"Missing dependency: {e}. Run: pip3 install openpyxl pandas",
+            "exitCode": 1
+        }), flush=True)
+        sys.exit(1)
 
 
 # ── Tuning constants (same as original, proven on real files) ──────────────────
@@ -62,6 +96,26 @@ MIN_DENSE_ROWS     = 2    # min rows with ≥ MIN_FILLED_CELLS values to qualify
 MIN_FILLED_CELLS   = 3    # cells per row to count as "dense"
 MAX_AVG_HEADER_LEN = 80   # max avg char length per cell in a header row
 MIN_UNIQUE_RATIO   = 0.5  # min fraction of unique values in a header row
+HEADER_SCAN_ROWS   = int(os.environ.get("EXCEL_HEADER_SCAN_ROWS", "1000"))  # rows scored as header candidates (0 = all)
+
+# ── Streaming mode (read-only workbook, bounded memory) ────────────────────────
+# auto → stream workbooks of at least EXCEL_STREAMING_MIN_MB; always / never force it
+STREAMING_MODE     = os.environ.get("EXCEL_STREAMING", "auto").lower()
+STREAMING_MIN_MB   = float(os.environ.get("EXCEL_STREAMING_MIN_MB", "10"))
+STREAM_CHUNK_ROWS  = 5000          # rows per pandas chunk
+STREAM_BLOCK_CHARS = 1024 * 1024   # text copied to stdout in blocks of this size
+SHEET_NS           = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+# ── Parallel sheets (process pool, each worker streams its own sheets) ─────────
+SHEET_WORKERS      = int(os.environ.get("EXCEL_SHEET_WORKERS", "0"))   # 0 = min(4, CPUs); 1 = serial
+PARALLEL_MIN_MB    = float(os.environ.get("EXCEL_PARALLEL_MIN_MB", "2"))  # smaller workbooks stay serial
+
+# ── Daemon mode (warm imports, process pool behind a Unix socket) ──────────────
+DAEMON_MODE            = os.environ.get("EXCEL_DAEMON", "auto").lower()  # auto | on | off
+DAEMON_SOCKET          = os.environ.get("EXCEL_DAEMON_SOCKET", "/tmp/excel_extractor.sock")
+DAEMON_WORKERS         = max(1, int(os.environ.get("EXCEL_DAEMON_WORKERS", "2")))
+DAEMON_CONNECT_TIMEOUT = 2    # seconds; the daemon answers connect() immediately when alive
+DAEMON_TASKS_PER_CHILD = 100  # recycle pool workers so pandas/openpyxl memory can't creep
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -90,24 +144,35 @@ def get_matrix(ws) -> list:
     return [[cell.value for cell in row] for row in ws.iter_rows()]
 
 
-def count_dense_rows(matrix) -> int:
-    return sum(
-        1 for row in matrix
-        if sum(1 for v in row if is_filled(v)) >= MIN_FILLED_CELLS
-    )
+def row_filled_counts(matrix) -> list:
+    """Number of filled cells per row, computed once and shared by the scorers below."""
+    return [sum(1 for v in row if is_filled(v)) for row in matrix]
+
+
+def count_dense_rows(matrix, filled_counts=None) -> int:
+    counts = filled_counts if filled_counts is not None else row_filled_counts(matrix)
+    return sum(1 for n in counts if n >= MIN_FILLED_CELLS)
 
 
-def find_header_row(matrix) -> int | None:
+def find_header_row(matrix, filled_counts=None) -> int | None:
     """
-    Find the best header row by scoring every candidate row.
+    Find the best header row by scoring candidate rows in the first
+    HEADER_SCAN_ROWS rows (headers sit near the top).
     Score = unique_filled_count × dense_rows_below_it
+    dense_rows_below_it comes from a suffix count, so the scan is linear.
     """
+    counts = filled_counts if filled_counts is not None else row_filled_counts(matrix)
+    dense_below = [0] * (len(counts) + 1)
+    for i in range(len(counts) - 1, -1, -1):
+        dense_below[i] = dense_below[i + 1] + (counts[i] >= MIN_FILLED_CELLS)
+
+    scan_rows = len(matrix) if HEADER_SCAN_ROWS <= 0 else min(len(matrix), HEADER_SCAN_ROWS)
     best_idx, best_score = None, 0
 
-    for i, row in enumerate(matrix):
-        filled = [v for v in row if is_filled(v)]
-        if len(filled) < MIN_FILLED_CELLS:
+    for i in range(scan_rows):
+        if counts[i] < MIN_FILLED_CELLS:
             continue
+        filled = [v for v in matrix[i] if is_filled(v)]
 
         avg_len = sum(len(str(v)) for v in filled) / len(filled)
         if avg_len >= MAX_AVG_HEADER_LEN:
@@ -117,11 +182,7 @@ def find_header_row(matrix) -> int | None:
         if len(unique_vals) / len(filled) < MIN_UNIQUE_RATIO:
             continue
 
-        dense_below = sum(
-            1 for j in range(i + 1, len(matrix))
-            if sum(1 for v in matrix[j] if is_filled(v)) >= MIN_FILLED_CELLS
-        )
-        score = len(unique_vals) * dense_below
+        score = len(unique_vals) * dense_below[i + 1]
 
         if score > best_score:
             best_score = score
@@ -151,18 +212,49 @@ def build_dataframe(matrix, header_row_idx: int) -> pd.DataFrame:
         for row in matrix[header_row_idx + 1:]
     ]
 
-    df = pd.DataFrame(rows, columns=columns)
-    df = df.dropna(how="all")
-    df = df[~df.apply(lambda r: all(not is_filled(v) for v in r), axis=1)]
-    df = df.dropna(axis=1, how="all")
-    empty_unnamed = [
-        c for c in df.columns
-        if c.startswith("Unnamed") and df[c].isna().all()
-    ]
-    df = df.drop(columns=empty_unnamed, errors="ignore")
-    df = df.map(lambda v: str(v).strip() if is_filled(v) else "")
+    notna, text = filter_rows(pd.DataFrame(rows, columns=columns))
+    return text.iloc[:, notna.any(axis=0)].reset_index(drop=True)
 
-    return df.reset_index(drop=True)
+
+def stringify_column(col: pd.Series) -> np.ndarray:
+    """
+    str(v).strip() for filled cells and "" for empty ones, column at a time.
+    NaN/NaT count as filled (is_filled only rejects None and blank text), so a
+    float column renders its gaps as "nan" exactly as a per-cell map would.
+    """
+    kind = col.dtype.kind
+    if kind in "biuf":
+        return col.to_numpy().astype(str).astype(object)
+
+    if kind == "O" or isinstance(col.dtype, pd.StringDtype):
+        values = col.to_numpy(dtype=object)
+        is_none = values == None  # noqa: E711 — elementwise identity with None
+        try:
+            stripped = col.str.strip().to_numpy(dtype=object)
+        except AttributeError:  # object column without any strings
+            stripped = np.full(len(col), np.nan, dtype=object)
+        out = np.where(is_none, "", stripped)
+        # Non-string values (numbers/dates in mixed columns, NaN in str columns)
+        other = ~is_none & pd.isna(stripped)
+        if other.any():
+            out[other] = [str(v).strip() for v in values[other]]
+        return out
+
+    # datetime64 / timedelta64 / anything exotic: Timestamp formatting, per cell
+    return col.map(lambda v: str(v).strip() if is_filled(v) else "").to_numpy(dtype=object)
+
+
+def filter_rows(df: pd.DataFrame) -> tuple:
+    """
+    Drop rows that are all-NA or have no filled cell, vectorised.
+    Returns (notna mask of the remaining rows, their stringified DataFrame);
+    the caller drops columns whose mask is all False.
+    """
+    text = np.column_stack([stringify_column(df.iloc[:, i]) for i in range(df.shape[1])]) \
+        if df.shape[1] else np.empty((len(df), 0), dtype=object)
+    notna = df.notna().to_numpy()
+    keep = notna.any(axis=1) & (text != "").any(axis=1)
+    return notna[keep], pd.DataFrame(text[keep], columns=df.columns)
 
 
 def df_to_text(df: pd.DataFrame, sheet_name: str) -> str:
@@ -174,18 +266,432 @@ def df_to_text(df: pd.DataFrame, sheet_name: str) -> str:
     lines = [f"=== Sheet: {sheet_name} ==="]
     lines.append(" | ".join(df.columns.tolist()))
     lines.append("-" * 80)
-    for _, row in df.iterrows():
-        lines.append(" | ".join(str(v) if v else "" for v in row))
+    lines.extend(render_rows(df))
     return "\n".join(lines)
 
 
+def render_rows(df: pd.DataFrame):
+    """Pipe-joined lines for a DataFrame of strings (csv-writer style, no iterrows)."""
+    return map(" | ".join, zip(*(df.iloc[:, i].tolist() for i in range(df.shape[1]))))
+
+
 def word_count(text: str) -> int:
     return len(text.split()) if text.strip() else 0
 
 
+# ── Streaming helpers ──────────────────────────────────────────────────────────
+# The streaming path reproduces the full-mode pipeline (unmerge_and_fill →
+# get_matrix → find_header_row → build_dataframe → df_to_text) without ever
+# holding a whole sheet: each sheet is re-read from the xlsx several times and
+# only per-column summaries are kept between passes.
+
+def use_streaming(fp: Path) -> bool:
+    if STREAMING_MODE == "always":
+        return True
+    if STREAMING_MODE == "never":
+        return False
+    return fp.stat().st_size >= STREAMING_MIN_MB * 1024 * 1024
+
+
+def read_merged_ranges(ws) -> list:
+    """
+    Read <mergeCell ref="..."> entries straight from the sheet XML.
+    Read-only worksheets don't expose merged_cells, and the element sits after
+    <sheetData>, so rows are cleared as they stream past.
+    Returns (min_col, min_row, max_col, max_row) tuples sorted by min_row.
+    """
+    merges = []
+    sheet_data = None
+    with ws._get_source() as src:
+        for event, el in ET.iterparse(src, events=("start", "end")):
+            if event == "start":
+                if el.tag == SHEET_NS + "sheetData":
+                    sheet_data = el
+            elif el.tag == SHEET_NS + "mergeCell":
+                merges.append(openpyxl.utils.range_boundaries(el.get("ref")))
+            elif el.tag == SHEET_NS + "row" and sheet_data is not None:
+                sheet_data.clear()
+    return sorted(merges, key=lambda m: m[1])
+
+
+def iter_sheet_rows(ws, merges):
+    """
+    Yield every row of a read-only sheet as a list, with merged ranges filled
+    from their top-left cell (the streaming equivalent of unmerge_and_fill).
+    Rows a merge extends past the last stored row are still produced.
+    """
+    ws.reset_dimensions()  # don't trust the <dimension> tag; full mode doesn't
+    last_merge_row = max((m[3] for m in merges), default=0)
+    pending, active = 0, []
+    row_idx = 0
+    rows = iter(ws.iter_rows(values_only=True))
+
+    while True:
+        values = next(rows, None)
+        row_idx += 1
+        if values is None:
+            if row_idx > last_merge_row:
+                return
+            values = ()
+        row = list(values)
+
+        while pending < len(merges) and merges[pending][1] <= row_idx:
+            min_col, min_row, max_col, max_row = merges[pending]
+            top_left = row[min_col - 1] if min_col <= len(row) else None
+            active.append((min_col, max_col, max_row, top_left))
+            pending += 1
+        if active:
+            active = [m for m in active if m[2] >= row_idx]
+            for min_col, max_col, _, top_left in active:
+                if len(row) < max_col:
+                    row.extend([None] * (max_col - len(row)))
+                for col in range(min_col - 1, max_col):
+                    row[col] = top_left
+
+        yield row
+
+
+def scan_sheet(ws, merges) -> tuple:
+    """
+    Pass 1: sheet width, dense-row count and the best header row.
+    Uses the same scoring and HEADER_SCAN_ROWS window as find_header_row. A candidate can only beat every
+    earlier one if it has strictly more unique values (it always has fewer
+    dense rows below it), so at most one candidate per column count is kept.
+    """
+    width, dense = 0, 0
+    candidates = []  # (row index, unique count, dense rows up to and including it, row)
+
+    for i, row in enumerate(iter_sheet_rows(ws, merges)):
+        width = max(width, len(row))
+        filled = [v for v in row if is_filled(v)]
+        if len(filled) < MIN_FILLED_CELLS:
+            continue
+        dense += 1
+        if 0 < HEADER_SCAN_ROWS <= i:
+            continue
+
+        unique_vals = set(str(v).strip() for v in filled)
+        if candidates and len(unique_vals) <= candidates[-1][1]:
+            continue
+        avg_len = sum(len(str(v)) for v in filled) / len(filled)
+        if avg_len >= MAX_AVG_HEADER_LEN:
+            continue
+        if len(unique_vals) / len(filled) < MIN_UNIQUE_RATIO:
+            continue
+        candidates.append((i, len(unique_vals), dense, row))
+
+    best, best_score = None, 0
+    for i, unique, dense_upto, row in candidates:
+        score = unique * (dense - dense_upto)
+        if score > best_score:
+            best_score, best = score, (i, row)
+
+    header_idx, header = best if best_score > 0 else (None, None)
+    return width, dense, header_idx, header
+
+
+def header_columns(header: list) -> list:
+    """Deduplicated column names, exactly as build_dataframe names them."""
+    seen = {}
+    columns = []
+    for col in header:
+        name = str(col).strip() if is_filled(col) else "Unnamed"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def iter_data_rows(ws, merges, header_idx: int, n_cols: int):
+    for i, row in enumerate(iter_sheet_rows(ws, merges)):
+        if i > header_idx:
+            yield (row + [None] * n_cols)[:n_cols]
+
+
+def column_exemplars(ws, merges, header_idx: int, n_cols: int) -> list:
+    """
+    Pass 2: a few rows whose per-column value types cover every type seen in
+    that column (plus the int range). Prepending them to each chunk makes pandas
+    infer the same dtype per column as it would on the full sheet, so NaN/float
+    rendering matches full mode exactly.
+    """
+    seen = [{} for _ in range(n_cols)]
+    for row in iter_data_rows(ws, merges, header_idx, n_cols):
+        for col, value in enumerate(row):
+            kinds = seen[col]
+            kind = type(value)
+            if kind is int:
+                if "int_min" not in kinds or value < kinds["int_min"]:
+                    kinds["int_min"] = value
+                if "int_max" not in kinds or value > kinds["int_max"]:
+                    kinds["int_max"] = value
+            elif kind not in kinds:
+                kinds[kind] = value
+
+    values = [list(kinds.values()) for kinds in seen]
+    depth = max((len(v) for v in values), default=0)
+    return [
+        [v[min(r, len(v) - 1)] for v in values]
+        for r in range(depth)
+    ]
+
+
+def iter_clean_chunks(ws, merges, header_idx: int, columns: list, exemplars: list):
+    """Yield filter_rows() results chunk by chunk (build_dataframe's row filters)."""
+    n_cols = len(columns)
+    chunk = []
+
+    def to_frame(rows):
+        return filter_rows(pd.DataFrame(exemplars + rows, columns=columns).iloc[len(exemplars):])
+
+    for row in iter_data_rows(ws, merges, header_idx, n_cols):
+        chunk.append(row)
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield to_frame(chunk)
+            chunk = []
+    if chunk:
+        yield to_frame(chunk)
+
+
+def stream_sheet_text(ws, sheet_name: str, out):
+    """
+    Extract one sheet in bounded memory, writing its text to the file `out`.
+    Returns (word_count, row_count, column_count), or None when the sheet
+    would be skipped in full mode.
+    """
+    merges = read_merged_ranges(ws)
+    width, dense, header_idx, header = scan_sheet(ws, merges)
+    if dense < MIN_DENSE_ROWS or header_idx is None:
+        return None
+
+    columns = header_columns((header + [None] * width)[:width])
+    exemplars = column_exemplars(ws, merges, header_idx, width)
+
+    # Pass 3: which columns survive dropna(axis=1, how="all") and how many rows remain
+    keep = [False] * width
+    row_count = 0
+    for notna, text in iter_clean_chunks(ws, merges, header_idx, columns, exemplars):
+        row_count += len(text)
+        for col, has_value in enumerate(notna.any(axis=0).tolist()):
+            keep[col] = keep[col] or has_value
+    kept = [col for col in range(width) if keep[col]]
+    if row_count == 0 or not kept:
+        return None
+
+    # Pass 4: render the pipe-separated text incrementally
+    lines = [f"=== Sheet: {sheet_name} ===", " | ".join(columns[col] for col in kept), "-" * 80]
+    out.write("\n".join(lines))
+    wc = sum(word_count(line) for line in lines)
+    for _, text in iter_clean_chunks(ws, merges, header_idx, columns, exemplars):
+        for line in render_rows(text.iloc[:, kept]):
+            out.write("\n" + line)
+            wc += word_count(line)
+
+    return wc, row_count, len(kept)
+
+
+def write_json_string_body(text_file, out) -> None:
+    """Copy a text file into stdout as the inside of a JSON string literal."""
+    text_file.seek(0)
+    for block in iter(lambda: text_file.read(STREAM_BLOCK_CHARS), ""):
+        out.write(json.dumps(block, ensure_ascii=False)[1:-1])
+
+
 # ── Main extractor ─────────────────────────────────────────────────────────────
 
-def extract(file_path: str, original_file_name: str) -> dict:
+def print_empty_result(file_prefix: str, original_file_name: str, sheets_skipped: list, out) -> int:
+    # No extractable sheets — return graceful empty result, not an error
+    print(json.dumps({
+        "filePrefix":       file_prefix,
+        "originalFileName": original_file_name,
+        "totalPages":       0,
+        "totalWords":       0,
+        "hasDiagrams":      False,
+        "fullDocument":     "",
+        "pages":            [],
+        "metadata": {
+            "sheetsExtracted": [],
+            "sheetsSkipped":   sheets_skipped,
+            "extractor":       "excel_extractor.py",
+            "note":            "No data sheets found in this Excel file."
+        }
+    }), file=out, flush=True)
+    return 0
+
+
+def extract_streaming(wb, file_prefix: str, original_file_name: str, out) -> int:
+    """
+    Read-only counterpart of the loop in extract(). Sheet text lives in temp
+    files and is copied into the JSON on `out` block by block, so peak memory
+    does not grow with row count. Output is byte-identical to full mode.
+    """
+    sheets = []
+    for sheet_name in wb.sheetnames:
+        text_file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        extracted = stream_sheet_text(wb[sheet_name], sheet_name, text_file)
+        if extracted is None:
+            text_file.close()
+        sheets.append((sheet_name, None if extracted is None else (text_file, *extracted)))
+    wb.close()
+
+    return write_streamed_result(file_prefix, original_file_name, sheets, out)
+
+
+def write_streamed_result(file_prefix: str, original_file_name: str, sheets: list, out) -> int:
+    """
+    Emit the extraction JSON for `sheets` — (sheet_name, None | (text_file,
+    word_count, row_count, column_count)) in workbook order — numbering pages
+    exactly as full mode does. Text files are closed once copied.
+    """
+    texts = []
+    pages = []
+    sheets_extracted = []
+    sheets_skipped = []
+
+    for sheet_name, extracted in sheets:
+        if extracted is None:
+            sheets_skipped.append(sheet_name)
+            continue
+
+        text_file, wc, row_count, column_count = extracted
+        texts.append(text_file)
+        sheets_extracted.append(sheet_name)
+        pages.append({
+            "pageNumber":    len(pages) + 1,
+            "sheetName":     sheet_name,
+            "text":          f"\x00{len(texts) - 1}\x00",  # placeholder, streamed below
+            "wordCount":     wc,
+            "rowCount":      row_count,
+            "columnCount":   column_count,
+            "visionAnalysis": {},
+            "isDiagram":     False
+        })
+
+    if not pages:
+        return print_empty_result(file_prefix, original_file_name, sheets_skipped, out)
+
+    skeleton = json.dumps({
+        "filePrefix":       file_prefix,
+        "originalFileName": original_file_name,
+        "totalPages":       len(pages),
+        "totalWords":       sum(p["wordCount"] for p in pages),
+        "hasDiagrams":      False,
+        "fullDocument":     "\x00full\x00",
+        "pages":            pages,
+        "metadata": {
+            "sheetsExtracted": sheets_extracted,
+            "sheetsSkipped":   sheets_skipped,
+            "extractor":       "excel_extractor.py"
+        }
+    }, ensure_ascii=False, default=str)
+
+    for i, part in enumerate(re.split(r'\\u0000(full|\d+)\\u0000', skeleton)):
+        if i % 2 == 0:
+            out.write(part)
+        elif part == "full":
+            for n, text_file in enumerate(texts):
+                if n:
+                    out.write("\\n\\n")
+                write_json_string_body(text_file, out)
+        else:
+            write_json_string_body(texts[int(part)], out)
+    out.write("\n")
+    out.flush()
+
+    for text_file in texts:
+        text_file.close()
+    return 0
+
+
+# ── Parallel sheets ───────────────────────────────────────────────────────────
+
+def sheet_worker_count(fp: Path) -> int:
+    # Workers use the streaming path, so EXCEL_STREAMING=never keeps extraction serial too
+    if STREAMING_MODE == "never" or fp.stat().st_size < PARALLEL_MIN_MB * 1024 * 1024:
+        return 1
+    return SHEET_WORKERS if SHEET_WORKERS > 0 else min(4, os.cpu_count() or 1)
+
+
+def assign_sheets(wb, workers: int) -> list:
+    """
+    Split sheets into at most `workers` groups of similar total size
+    (uncompressed sheet XML, largest first onto the lightest group).
+    """
+    sizes = []
+    for sheet_name in wb.sheetnames:
+        ws = wb[sheet_name]
+        try:
+            size = wb._archive.getinfo(ws._worksheet_path).file_size
+        except (AttributeError, KeyError):
+            size = 0
+        sizes.append((size, sheet_name))
+
+    groups = [[0, []] for _ in range(min(workers, len(sizes)))]
+    for size, sheet_name in sorted(sizes, key=lambda x: -x[0]):
+        lightest = min(groups, key=lambda g: g[0])
+        lightest[0] += size
+        lightest[1].append(sheet_name)
+    return [names for _, names in groups if names]
+
+
+def extract_sheet_group(file_path: str, sheet_names: list) -> list:
+    """
+    Pool worker: open the workbook read-only and stream the assigned sheets.
+    Returns [(sheet_name, None | (text_path, word_count, row_count, column_count))].
+    """
+    wb = openpyxl.load_workbook(file_path, data_only=True, read_only=True)
+    results = []
+    try:
+        for sheet_name in sheet_names:
+            with tempfile.NamedTemporaryFile(
+                mode="w", encoding="utf-8", prefix="excel_sheet_", suffix=".txt", delete=False
+            ) as text_file:
+                extracted = stream_sheet_text(wb[sheet_name], sheet_name, text_file)
+            if extracted is None:
+                os.remove(text_file.name)
+                results.append((sheet_name, None))
+            else:
+                results.append((sheet_name, (text_file.name, *extracted)))
+    finally:
+        wb.close()
+    return results
+
+
+def extract_parallel(wb, fp: Path, file_prefix: str, original_file_name: str, workers: int, out) -> int:
+    """
+    Stream sheets in a process pool, one group of sheets per worker, then
+    merge results back in workbook order so pageNumber matches serial mode.
+    """
+    sheet_order = list(wb.sheetnames)
+    groups = assign_sheets(wb, workers)
+    wb.close()
+
+    by_sheet = {}
+    try:
+        with ProcessPoolExecutor(max_workers=len(groups), initializer=import_dependencies) as pool:
+            for group_result in pool.map(extract_sheet_group, [str(fp)] * len(groups), groups):
+                by_sheet.update(group_result)
+
+        sheets = []
+        for sheet_name in sheet_order:
+            extracted = by_sheet[sheet_name]
+            if extracted is not None:
+                text_path, wc, row_count, column_count = extracted
+                extracted = (open(text_path, encoding="utf-8"), wc, row_count, column_count)
+            sheets.append((sheet_name, extracted))
+        return write_streamed_result(file_prefix, original_file_name, sheets, out)
+    finally:
+        for extracted in by_sheet.values():
+            if extracted is not None and os.path.exists(extracted[0]):
+                os.remove(extracted[0])
+
+
+def extract(file_path: str, original_file_name: str, out=None) -> int:
+    """Write the extraction JSON to `out` (stdout by default); returns the exit code."""
+    out = out or sys.stdout
     fp = Path(file_path)
 
     # Derive filePrefix from the temp filename (strip "input.xlsx" suffix)
@@ -194,8 +700,10 @@ def extract(file_path: str, original_file_name: str) -> dict:
     if match:
         file_prefix = match.group(1)
 
+    streaming = use_streaming(fp)
+    workers = sheet_worker_count(fp)
     try:
-        wb = openpyxl.load_workbook(str(fp), data_only=True)
+        wb = openpyxl.load_workbook(str(fp), data_only=True, read_only=streaming or workers > 1)
     except Exception as e:
         err_msg = str(e)
         if "encrypted" in err_msg.lower() or "password" in err_msg.lower():
@@ -203,14 +711,19 @@ def extract(file_path: str, original_file_name: str) -> dict:
                 "error": "Excel file is password-protected and cannot be processed.",
                 "errorCode": "EXCEL_ENCRYPTED",
                 "originalFileName": original_file_name
-            }), flush=True)
+            }), file=out, flush=True)
         else:
             print(json.dumps({
                 "error": f"Failed to open Excel file: {err_msg}",
                 "errorCode": "EXCEL_CORRUPT",
                 "originalFileName": original_file_name
-            }), flush=True)
-        sys.exit(2)
+            }), file=out, flush=True)
+        return 2
+
+    if workers > 1 and len(wb.sheetnames) > 1:
+        return extract_parallel(wb, fp, file_prefix, original_file_name, workers, out)
+    if streaming or workers > 1:
+        return extract_streaming(wb, file_prefix, original_file_name, out)
 
     pages = []
     sheets_extracted = []
@@ -222,12 +735,13 @@ def extract(file_path: str, original_file_name: str) -> dict:
         unmerge_and_fill(ws)
         matrix = get_matrix(ws)
 
-        dense = count_dense_rows(matrix)
+        filled_counts = row_filled_counts(matrix)
+        dense = count_dense_rows(matrix, filled_counts)
         if dense < MIN_DENSE_ROWS:
             sheets_skipped.append(sheet_name)
             continue
 
-        header_idx = find_header_row(matrix)
+        header_idx = find_header_row(matrix, filled_counts)
         if header_idx is None:
             sheets_skipped.append(sheet_name)
             continue
@@ -254,23 +768,7 @@ def extract(file_path: str, original_file_name: str) -> dict:
         })
 
     if not pages:
-        # No extractable sheets — return graceful empty result, not an error
-        print(json.dumps({
-            "filePrefix":       file_prefix,
-            "originalFileName": original_file_name,
-            "totalPages":       0,
-            "totalWords":       0,
-            "hasDiagrams":      False,
-            "fullDocument":     "",
-            "pages":            [],
-            "metadata": {
-                "sheetsExtracted": [],
-                "sheetsSkipped":   sheets_skipped,
-                "extractor":       "excel_extractor.py",
-                "note":            "No data sheets found in this Excel file."
-            }
-        }), flush=True)
-        sys.exit(0)
+        return print_empty_result(file_prefix, original_file_name, sheets_skipped, out)
 
     full_document = "\n\n".join(p["text"] for p in pages)
     total_words = sum(p["wordCount"] for p in pages)
@@ -290,13 +788,162 @@ def extract(file_path: str, original_file_name: str) -> dict:
         }
     }
 
-    print(json.dumps(result, ensure_ascii=False, default=str), flush=True)
-    sys.exit(0)
+    print(json.dumps(result, ensure_ascii=False, default=str), file=out, flush=True)
+    return 0
+
+
+# ── Daemon ────────────────────────────────────────────────────────────────────
+
+def extract_to_file(file_path: str, original_file_name: str) -> tuple:
+    """Pool worker: run extract() into a temp file so large results never sit in a pipe."""
+    fd, result_path = tempfile.mkstemp(prefix="excel_extractor_", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        try:
+            code = extract(file_path, original_file_name, out)
+        except Exception as e:
+            out.seek(0)
+            out.truncate()
+            print(json.dumps({
+                "error": f"Excel extraction failed: {e}",
+                "errorCode": "EXCEL_EXTRACTION_FAILED",
+                "originalFileName": original_file_name
+            }), file=out, flush=True)
+            code = 2
+    return code, result_path
+
+
+class ExtractionHandler(socketserver.StreamRequestHandler):
+    """
+    One request per connection.
+    Request:  {"filePath": "...", "originalFileName": "..."}\n
+    Response: "<exit code>\n" followed by exactly what the CLI would print.
+    Closing without a status line tells the client to extract in-process.
+    """
+
+    def handle(self):
+        server = self.server
+        if os.path.getmtime(__file__) != server.script_mtime:
+            # Script was updated on disk — let the client fall back and retire this daemon
+            threading.Thread(target=server.shutdown, daemon=True).start()
+            return
+
+        request = json.loads(self.rfile.readline() or b"{}")
+        try:
+            code, result_path = server.pool.submit(
+                extract_to_file, request["filePath"], request["originalFileName"]
+            ).result()
+        except BrokenProcessPool:
+            server.reset_pool()
+            return
+
+        try:
+            self.wfile.write(f"{code}\n".encode("utf-8"))
+            with open(result_path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        finally:
+            os.remove(result_path)
+
+
+class ExtractionServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int):
+        self.workers = workers
+        self.script_mtime = os.path.getmtime(__file__)
+        self.pool = self._new_pool()
+        for _ in range(workers):
+            self.pool.submit(int)  # start every worker now so the first requests find imports warm
+        self._pool_lock = threading.Lock()
+        super().__init__(socket_path, ExtractionHandler)
+
+    def reset_pool(self) -> None:
+        with self._pool_lock:
+            if getattr(self.pool, "_broken", False):
+                self.pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # forkserver: handler threads are running, so plain fork() is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=import_dependencies,
+            max_tasks_per_child=DAEMON_TASKS_PER_CHILD
+        )
+
+
+def serve(socket_path: str = DAEMON_SOCKET, workers: int = DAEMON_WORKERS) -> None:
+    import_dependencies()
+
+    if os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            print(f"excel_extractor daemon already running on {socket_path}", file=sys.stderr)
+            return
+        except OSError:
+            os.remove(socket_path)  # stale socket from a dead daemon
+
+    with ExtractionServer(socket_path, workers) as server:
+        print(f"excel_extractor daemon listening on {socket_path} ({workers} workers)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            server.pool.shutdown(cancel_futures=True)
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def spawn_daemon() -> None:
+    """Start a detached daemon for later calls (stdio closed so n8n isn't kept waiting)."""
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True, close_fds=True
+    )
+
+
+def request_daemon(file_path: str, original_file_name: str) -> int | None:
+    """
+    Run the extraction on the daemon and copy its reply to stdout.
+    Returns the exit code, or None when the caller should extract in-process.
+    """
+    if DAEMON_MODE == "off":
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        sock.connect(DAEMON_SOCKET)
+        sock.settimeout(None)
+        sock.sendall(json.dumps({
+            "filePath": os.path.abspath(file_path),
+            "originalFileName": original_file_name
+        }).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reply:
+            status = reply.readline().strip()
+            if not status:
+                return None
+            code = int(status)
+            shutil.copyfileobj(reply, sys.stdout.buffer)
+        sys.stdout.flush()
+        return code
+    except (FileNotFoundError, ConnectionRefusedError):
+        if DAEMON_MODE == "auto":
+            spawn_daemon()
+        return None
+    except (OSError, ValueError):
+        return None
+    finally:
+        sock.close()
 
 
 # ── Entry point ───────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve()
+        sys.exit(0)
+
     if len(sys.argv) < 2:
         print(json.dumps({
             "error": "Usage: excel_extractor.py <file_path> [original_file_name]",
@@ -315,4 +962,8 @@ if __name__ == "__main__":
         }), flush=True)
         sys.exit(1)
 
-    extract(file_path, original_name)
+    code = request_daemon(file_path, original_name)
+    if code is None:
+        import_dependencies()
+        code = extract(file_path, original_name)
+    sys.exit(code)
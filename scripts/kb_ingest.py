@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+KB Ingestion Engine for n8n Compliance Workflow B
+=================================================
+Embeds a standard's chunks and writes them to Qdrant in bulk. Replaces the
+per-chunk HTTP nodes (one /api/embeddings call and one upsert request per
+chunk) with:
+
+  * batched embedding through Ollama's /api/embed (KB_EMBED_BATCH chunks per
+    request) with at most KB_EMBED_INFLIGHT requests in flight,
+  * bulk upserts of KB_UPSERT_BATCH points with wait=false, so Qdrant indexes
+    while the next batches are still being embedded,
+  * a consistency barrier: the points for the file are counted until all of
+    them are visible to search.
+
+Re-ingesting a revised standard is incremental. Point ids are derived from the
+chunk's content hash (plus domain and standard name), so chunks that did not
+change between revisions already exist in Qdrant: they are not re-embedded,
+only re-tagged with the new file's payload. Only points owned by this file or
+by the revisions it replaces (document.previous.fileHashes, looked up by
+Workflow B when the upload asks for replace=true) are reused. A chunk whose
+content id belongs to another file gets an id scoped to this file instead, so
+the other document keeps its point. Points of the previous revisions that are
+not part of the new revision are deleted after the barrier. mode=full forces
+every chunk to be re-embedded, e.g. after switching embedding models.
+
+The document is chunked with chunker.py (token-aware, page/sheet/heading
+boundaries), and each point's payload carries pageNumber, pageEnd, sheetName and
+heading.
+
+Called by n8n's Execute Command node after Stage Document:
+    python3 /scripts/kb_ingest.py /tmp/n8n_processing/kb_<fileHash>_document.json
+
+The input file is the Workflow A extraction plus the standard's metadata:
+    {"standardName": "...", "domain": "...", "version": "...",
+     "metadata": {"originalFileName": "...", "fileHash": "..."},
+     "mode": "diff" | "full", "previous": {"fileHashes": [...]},
+     "pages": [...], "fullDocument": "..."}
+
+Outputs a single JSON report to stdout:
+{
+  "collection":     "compliance_standards",
+  "mode":           "diff" | "full",
+  "chunks":         <int>,
+  "chunksEmbedded": <int>,
+  "chunksReused":   <int>,
+  "pointsDeleted":  <int>,
+  "pointsVisible":  <int>,
+  "embedBatches":   <int>,
+  "upsertBatches":  <int>,
+  "embedSeconds":   <float>,
+  "totalSeconds":   <float>,
+  "chunksPerSec":   <float>,
+  "chunkRecords":   [{"chunk_hash", "point_id", "chunk_index", "token_count", "page_number"}]
+}
+
+Exit codes:
+  0 — success (report printed to stdout)
+  1 — input file missing or unreadable
+  2 — ingestion error (Ollama/Qdrant failure, barrier timeout)
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chunker import chunk_document  # noqa: E402
+
+
+# ── Tuning constants ───────────────────────────────────────────────────────────
+OLLAMA_URL       = os.environ.get("OLLAMA_HOST", "http://ollama:11434").rstrip("/")
+QDRANT_URL       = os.environ.get("QDRANT_HOST", "http://qdrant:6333").rstrip("/")
+COLLECTION       = os.environ.get("KB_COLLECTION", "compliance_standards")
+EMBED_MODEL      = "nomic-embed-text"
+VECTOR_SIZE      = 768
+EMBED_BATCH      = max(1, int(os.environ.get("KB_EMBED_BATCH", "32")))
+EMBED_INFLIGHT   = max(1, int(os.environ.get("KB_EMBED_INFLIGHT", "2")))
+UPSERT_BATCH     = max(1, int(os.environ.get("KB_UPSERT_BATCH", "256")))
+EMBED_TIMEOUT    = 300
+QDRANT_TIMEOUT   = 120
+BARRIER_TIMEOUT  = int(os.environ.get("KB_BARRIER_TIMEOUT", "120"))
+
+
+class IngestError(Exception):
+    pass
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+
+def call_json(method: str, url: str, payload=None, timeout: int = QDRANT_TIMEOUT) -> dict:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8") or "{}")
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8", "replace")[:300]
+        raise IngestError(f"HTTP {e.code} from {method} {url}: {detail}") from e
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        raise IngestError(f"{method} {url} failed: {e}") from e
+
+
+def ensure_collection():
+    url = f"{QDRANT_URL}/collections/{COLLECTION}"
+    try:
+        call_json("GET", url)
+        return
+    except IngestError as e:
+        if "HTTP 404" not in str(e):
+            raise
+    call_json("PUT", url, {"vectors": {"size": VECTOR_SIZE, "distance": "Cosine"}})
+
+
+def embed_batch(texts: list) -> list:
+    response = call_json("POST", f"{OLLAMA_URL}/api/embed", {
+        "model": EMBED_MODEL,
+        "input": texts,
+        "options": {"num_gpu": 999, "num_thread": 4}
+    }, timeout=EMBED_TIMEOUT)
+    vectors = response.get("embeddings")
+    if not isinstance(vectors, list) or len(vectors) != len(texts):
+        raise IngestError(f"Ollama returned {len(vectors or [])} embeddings for {len(texts)} chunks")
+    return vectors
+
+
+def upsert(points: list, wait: bool):
+    flag = "true" if wait else "false"
+    call_json("PUT", f"{QDRANT_URL}/collections/{COLLECTION}/points?wait={flag}", {"points": points})
+
+
+# ── Points ────────────────────────────────────────────────────────────────────
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(document: dict, content_hash: str, file_hash: str = None) -> str:
+    """
+    Content-addressed id: the same text in the same standard always maps to the same point.
+    With file_hash the id is scoped to one file, for content whose shared id another file owns.
+    """
+    key = f"{document.get('domain')}\x1f{document.get('standardName')}\x1f{content_hash}"
+    if file_hash:
+        key += f"\x1f{file_hash}"
+    h = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+
+
+def point_payload(document: dict, chunk: dict) -> dict:
+    return {
+        "text": chunk["text"],
+        "chunkHash": chunk["chunkHash"],
+        "standardName": document.get("standardName"),
+        "domain": document.get("domain"),
+        "version": document.get("version"),
+        "chunkIndex": chunk.get("chunkIndex"),
+        "tokenCount": chunk.get("tokenCount"),
+        "pageNumber": chunk.get("pageNumber"),
+        "pageEnd": chunk.get("pageEnd"),
+        "sheetName": chunk.get("sheetName"),
+        "heading": chunk.get("heading"),
+        "metadata": document.get("metadata") or {}
+    }
+
+
+def document_chunks(document: dict) -> list:
+    """Chunker output with content hashes and point ids; repeated chunks are kept once."""
+    chunks, seen = [], set()
+    for chunk in chunk_document(document):
+        content_hash = chunk_hash(chunk["text"])
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        chunks.append({**chunk, "chunkHash": content_hash, "pointId": point_id(document, content_hash)})
+    return chunks
+
+
+def claim_points(document: dict, chunks: list, file_hash: str, previous: list) -> dict:
+    """
+    Point id → owning metadata.fileHash for the chunks' points that already exist.
+    A chunk whose content id is owned by a file outside this lineage (file_hash
+    plus the revisions it replaces) is moved to its file-scoped id, so it never
+    re-tags or overwrites another document's point.
+    """
+    lineage = set(previous) | {file_hash}
+    existing = existing_points([c["pointId"] for c in chunks])
+    contested = [c for c in chunks if c["pointId"] in existing and existing[c["pointId"]] not in lineage]
+    for c in contested:
+        c["pointId"] = point_id(document, c["chunkHash"], file_hash)
+    if contested:
+        scoped = existing_points([c["pointId"] for c in contested])
+        existing.update({pid: owner for pid, owner in scoped.items() if owner in lineage})
+    return {pid: owner for pid, owner in existing.items() if owner in lineage}
+
+
+def existing_points(ids: list) -> dict:
+    """Point id → metadata.fileHash for the ids already stored in the collection."""
+    found = {}
+    for start in range(0, len(ids), 1000):
+        response = call_json("POST", f"{QDRANT_URL}/collections/{COLLECTION}/points", {
+            "ids": ids[start:start + 1000], "with_payload": ["metadata"], "with_vector": False
+        })
+        for point in response.get("result") or []:
+            found[str(point["id"])] = ((point.get("payload") or {}).get("metadata") or {}).get("fileHash")
+    return found
+
+
+def overwrite_payloads(operations: list):
+    call_json("POST", f"{QDRANT_URL}/collections/{COLLECTION}/points/batch?wait=false", {"operations": operations})
+
+
+def delete_file_points(file_hashes: list):
+    call_json("POST", f"{QDRANT_URL}/collections/{COLLECTION}/points/delete?wait=true", {
+        "filter": {"must": [{"key": "metadata.fileHash", "match": {"any": file_hashes}}]}
+    })
+
+
+def count_file_points(file_hashes: list) -> int:
+    response = call_json("POST", f"{QDRANT_URL}/collections/{COLLECTION}/points/count", {
+        "filter": {"must": [{"key": "metadata.fileHash", "match": {"any": file_hashes}}]},
+        "exact": True
+    })
+    return int(response.get("result", {}).get("count", 0))
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+
+def ingest(document: dict, chunks: list) -> dict:
+    """
+    Diff mode (default): chunks whose point already exists in this file's lineage
+    (claim_points) are not re-embedded, only re-tagged with this file's payload.
+    mode=full re-embeds every chunk (e.g. after an embedding model change). In
+    both modes, points of the previous revisions (document.previous.fileHashes)
+    that are not part of this revision are deleted once the new revision is
+    fully visible.
+    """
+    started = time.perf_counter()
+    ensure_collection()
+
+    file_hash = (document.get("metadata") or {}).get("fileHash")
+    full = document.get("mode") == "full"
+    previous = [h for h in ((document.get("previous") or {}).get("fileHashes") or []) if h and h != file_hash]
+
+    existing = claim_points(document, chunks, file_hash, previous)
+    reused = [] if full else [c for c in chunks if c["pointId"] in existing]
+    to_embed = chunks if full else [c for c in chunks if c["pointId"] not in existing]
+    stale = count_file_points(previous) - sum(1 for c in chunks if existing.get(c["pointId"]) in previous) if previous else 0
+
+    batches = [to_embed[i:i + EMBED_BATCH] for i in range(0, len(to_embed), EMBED_BATCH)]
+    pending, buffered = [], []
+    embed_seconds, upsert_batches, upserted = 0.0, 0, 0
+
+    def timed_embed(batch):
+        t0 = time.perf_counter()
+        vectors = embed_batch([c["text"] for c in batch])
+        return batch, vectors, time.perf_counter() - t0
+
+    def flush(final: bool):
+        nonlocal upsert_batches, upserted
+        while len(buffered) >= UPSERT_BATCH or (final and buffered):
+            points = buffered[:UPSERT_BATCH]
+            del buffered[:UPSERT_BATCH]
+            upsert(points, wait=False)
+            upsert_batches += 1
+            upserted += len(points)
+
+    def collect(done_batch, vectors):
+        buffered.extend(
+            {"id": c["pointId"], "vector": v, "payload": point_payload(document, c)}
+            for c, v in zip(done_batch, vectors)
+        )
+        flush(final=False)
+
+    # Bounded window: at most EMBED_INFLIGHT batches are being embedded at once,
+    # results are consumed in submission order so upserts stream out behind them
+    with ThreadPoolExecutor(max_workers=EMBED_INFLIGHT) as pool:
+        for batch in batches:
+            pending.append(pool.submit(timed_embed, batch))
+            if len(pending) >= EMBED_INFLIGHT:
+                done_batch, vectors, seconds = pending.pop(0).result()
+                embed_seconds += seconds
+                collect(done_batch, vectors)
+        for future in pending:
+            done_batch, vectors, seconds = future.result()
+            embed_seconds += seconds
+            collect(done_batch, vectors)
+    flush(final=True)
+
+    # Unchanged chunks keep their vector; only the payload moves to this revision
+    for start in range(0, len(reused), UPSERT_BATCH):
+        overwrite_payloads([
+            {"overwrite_payload": {"payload": point_payload(document, c), "points": [c["pointId"]]}}
+            for c in reused[start:start + UPSERT_BATCH]
+        ])
+        upsert_batches += 1
+
+    # Consistency barrier: every chunk of this file must be searchable before the
+    # previous revision is removed and Workflow B records the standard in kb_standards
+    visible = len(chunks)
+    if file_hash:
+        deadline = time.monotonic() + BARRIER_TIMEOUT
+        visible = count_file_points([file_hash])
+        while visible < len(chunks):
+            if time.monotonic() > deadline:
+                raise IngestError(f"Only {visible}/{len(chunks)} points visible in {COLLECTION} after {BARRIER_TIMEOUT}s")
+            time.sleep(0.5)
+            visible = count_file_points([file_hash])
+    if previous:
+        delete_file_points(previous)
+
+    total = time.perf_counter() - started
+    return {
+        "collection": COLLECTION,
+        "mode": "full" if full else "diff",
+        "chunks": len(chunks),
+        "chunksEmbedded": upserted,
+        "chunksReused": len(reused),
+        "pointsDeleted": max(0, stale),
+        "pointsVisible": visible,
+        "embedBatches": len(batches),
+        "upsertBatches": upsert_batches,
+        "embedSeconds": round(embed_seconds, 3),
+        "totalSeconds": round(total, 3),
+        "chunksPerSec": round(len(chunks) / total, 1) if total > 0 else None,
+        # Rows for kb_standard_chunks
+        "chunkRecords": [
+            {
+                "chunk_hash": c["chunkHash"],
+                "point_id": c["pointId"],
+                "chunk_index": c["chunkIndex"],
+                "token_count": c["tokenCount"],
+                "page_number": c["pageNumber"]
+            }
+            for c in chunks
+        ]
+    }
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def fail(error: str, error_code: str, exit_code: int = 2):
+    print(json.dumps({"error": error, "errorCode": error_code}), flush=True)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        fail("Usage: kb_ingest.py <document.json>", "INGEST_USAGE", 1)
+
+    try:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            document = json.load(f)
+    except (OSError, ValueError) as e:
+        fail(f"Cannot read document file {sys.argv[1]}: {e}", "INGEST_INPUT", 1)
+
+    chunks = document_chunks(document)
+    if not chunks:
+        fail("No text content to chunk — pages and fullDocument are empty", "INGEST_EMPTY", 1)
+
+    try:
+        report = ingest(document, chunks)
+    except IngestError as e:
+        fail(str(e), "INGEST_FAILED")
+
+    print(json.dumps(report), flush=True)
+    sys.exit(0)
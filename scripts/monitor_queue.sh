@@ -18,9 +18,10 @@ REDIS_CONTAINER="compliance-redis"
 DB_CONTAINER="compliance-db"
 N8N_CONTAINER="compliance-n8n"
 
-# Redis queue key (must match workflow-c1-audit-entry.json LPUSH and
-# workflow-c2-audit-worker.json RPOP configuration)
+# Redis queue key (must match workflow-c1-audit-entry.json LPUSH and the
+# queue-worker service's AUDIT_QUEUE_KEY; it BLMOVEs jobs into per-consumer lists)
 QUEUE_KEY="audit_job_queue"
+DEAD_KEY="${QUEUE_KEY}:dead"
 
 # Shared processing volume — host-side path of the 'shared_processing' Docker named volume
 PROCESSING_DIR="/var/lib/docker/volumes/n8n-poc-compliance_shared_processing/_data"
@@ -60,12 +61,15 @@ get_queue_stats() {
     echo -e "\n${BLUE}━━━ Redis Queue Status ━━━${NC}"
 
     local pending=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN "$QUEUE_KEY" 2>/dev/null || echo "ERROR")
-    local processing=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN compliance:jobs:processing 2>/dev/null || echo "0")
-    local failed=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN compliance:jobs:failed 2>/dev/null || echo "0")
+    local processing=0
+    for key in $(docker exec "$REDIS_CONTAINER" redis-cli --scan --pattern "${QUEUE_KEY}:processing:*" 2>/dev/null); do
+        processing=$((processing + $(docker exec "$REDIS_CONTAINER" redis-cli LLEN "$key" 2>/dev/null || echo 0)))
+    done
+    local failed=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN "$DEAD_KEY" 2>/dev/null || echo "0")
     
     echo " Pending Jobs:    $pending"
     echo " Processing Jobs: $processing"
-    echo " Failed Jobs:     $failed"
+    echo " Dead-lettered:   $failed"
     
     if [ "$pending" != "ERROR" ] && [ "$pending" -gt 0 ]; then
         echo -e "\n${YELLOW}⚠ Warning: $pending jobs waiting in queue${NC}"
@@ -77,7 +81,7 @@ get_queue_stats() {
     
     if [ "$failed" != "0" ] && [ "$failed" -gt 0 ]; then
         echo -e "\n${RED}✗ Error: $failed failed jobs detected${NC}"
-        echo "View failed jobs: docker exec $REDIS_CONTAINER redis-cli LRANGE compliance:jobs:failed 0 -1"
+        echo "View failed jobs: docker exec $REDIS_CONTAINER redis-cli LRANGE $DEAD_KEY 0 -1"
     fi
 }
 
@@ -124,7 +128,7 @@ get_session_stats() {
 get_worker_status() {
     echo -e "\n${BLUE}━━━ Worker Status (Workflow C2) ━━━${NC}"
     
-    # Check last cron execution
+    # Last job picked up by the queue-worker service
     local last_exec=$(docker exec "$DB_CONTAINER" psql -U n8n -d compliance_db -t -c \
         "SELECT MAX(created_at) FROM audit_logs WHERE step_name = 'processing';" 2>/dev/null | tr -d ' ')
     
@@ -264,7 +268,7 @@ cleanup_temp_files() {
 show_failed_jobs() {
     echo -e "${BLUE}━━━ Failed Jobs ━━━${NC}\n"
     
-    local failed_count=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN compliance:jobs:failed 2>/dev/null || echo "0")
+    local failed_count=$(docker exec "$REDIS_CONTAINER" redis-cli LLEN "$DEAD_KEY" 2>/dev/null || echo "0")
     
     if [ "$failed_count" == "0" ]; then
         echo -e "${GREEN}✓ No failed jobs${NC}"
@@ -273,8 +277,8 @@ show_failed_jobs() {
     
     echo -e "${RED}Found $failed_count failed job(s):${NC}\n"
     
-    docker exec "$REDIS_CONTAINER" redis-cli LRANGE compliance:jobs:failed 0 -1 | while read -r job; do
-        echo "$job" | jq -r '. | "Session: \(.sessionId)\nError: \(.error)\nFailed At: \(.failedAt)\n---"' 2>/dev/null || echo "$job"
+    docker exec "$REDIS_CONTAINER" redis-cli LRANGE "$DEAD_KEY" 0 -1 | while read -r job; do
+        echo "$job" | jq -r '. | "Session: \(.sessionId)\nAttempts: \(.attempts)\nError: \(.error)\nFailed At: \(.failedAt)\n---"' 2>/dev/null || echo "$job"
     done
 }
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+PDF Extractor for n8n Compliance Workflow A
+============================================
+Reads the embedded text layer with pdfplumber and only sends pages that need
+vision to Florence (scanned pages, near-empty pages, pages dominated by images).
+Policy documents are mostly text-native, so most pages never touch the model.
+Florence renders those pages itself from the PDF on the shared volume
+(/analyze_pdf), so no page images are written to /tmp/n8n_processing. Vision
+pages are sent in chunks while the text layer is still being read, so analysis
+of the first scanned pages overlaps reading (and rendering) the rest.
+
+Called by n8n's Execute Command node (PDF, and PPTX/DOCX after LibreOffice):
+    python3 /scripts/pdf_extractor.py /tmp/n8n_processing/<prefix>input.pdf <originalFileName>
+
+Outputs a single JSON object to stdout matching Workflow A's extraction contract:
+{
+  "filePrefix":       "<prefix>",
+  "originalFileName": "<name.pdf>",
+  "totalPages":       <int>,
+  "totalWords":       <int>,
+  "hasDiagrams":      <bool>,
+  "fullDocument":     "<text>",    # All pages concatenated
+  "pages": [
+    {
+      "pageNumber":     1,
+      "text":           "<page text>",
+      "wordCount":      <int>,
+      "visionAnalysis": {"description": "..."},   # {} for text-layer pages
+      "isDiagram":      <bool>,
+      "source":         "textLayer" | "vision"
+    }, ...
+  ],
+  "metadata": {
+    "pagesTextLayer": [...],
+    "pagesVision":    [...],
+    "extractor":      "pdf_extractor.py"
+  }
+}
+
+Exit codes:
+  0 — success (JSON printed to stdout)
+  1 — file not found or missing dependency
+  2 — extraction error (encrypted/corrupt file, Florence unavailable)
+"""
+
+import os
+import sys
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+try:
+    import pdfplumber
+except ImportError as e:
+    print(json.dumps({
+        "error": f"Missing dependency: {e}. Run: pip3 install pdfplumber",
+        "exitCode": 1
+    }), flush=True)
+    sys.exit(1)
+
+
+# ── Tuning constants ───────────────────────────────────────────────────────────
+MIN_TEXT_WORDS     = 25    # fewer words in the text layer → page goes to Florence
+LARGE_IMAGE_RATIO  = 0.35  # images covering ≥ this fraction of the page → Florence
+DIAGRAM_OCR_WORDS  = 30    # same heuristic as Workflow A: little OCR text → diagram
+FLORENCE_URL       = os.environ.get("FLORENCE_HOST", "http://florence:5000").rstrip("/") + "/analyze_pdf"
+FLORENCE_RETRIES   = 3
+VISION_CHUNK_PAGES = 8     # vision pages per /analyze_pdf call
+VISION_INFLIGHT    = 2     # /analyze_pdf calls in flight; Florence bounds its own render-ahead
+FLORENCE_TIMEOUT   = 3600
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def word_count(text: str) -> int:
+    return len(text.split()) if text.strip() else 0
+
+
+def image_coverage(page) -> float:
+    """Fraction of the page area covered by embedded images (clipped to the page)."""
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for img in page.images:
+        x0, x1 = max(img["x0"], 0), min(img["x1"], page.width)
+        top, bottom = max(img["top"], 0), min(img["bottom"], page.height)
+        if x1 > x0 and bottom > top:
+            covered += (x1 - x0) * (bottom - top)
+    return min(covered / page_area, 1.0)
+
+
+def needs_vision(text: str, coverage: float) -> bool:
+    return word_count(text) < MIN_TEXT_WORDS or coverage >= LARGE_IMAGE_RATIO
+
+
+def florence_analyze(pdf_path: str, page_numbers: list) -> list:
+    """
+    POST the PDF path and page numbers to Florence /analyze_pdf; returns results in page order.
+    A malformed or truncated response is retried like a network error; a 4xx reply (bad path,
+    unreadable pages, too large) is not. RuntimeError when the request fails.
+    """
+    body = json.dumps({"filePath": pdf_path, "pages": page_numbers}).encode("utf-8")
+    last_error = None
+    for attempt in range(FLORENCE_RETRIES):
+        try:
+            req = urllib.request.Request(
+                FLORENCE_URL, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(req, timeout=FLORENCE_TIMEOUT) as resp:
+                payload = json.loads(resp.read().decode("utf-8"))
+            results = payload.get("results") if isinstance(payload, dict) else None
+            if not isinstance(results, list) or len(results) != len(page_numbers) \
+                    or not all(isinstance(r, dict) for r in results):
+                raise ValueError(f"unexpected /analyze_pdf response: {str(payload)[:200]}")
+            return results
+        except urllib.error.HTTPError as e:
+            if e.code < 500:
+                detail = e.read().decode("utf-8", "replace")[:300]
+                raise RuntimeError(f"Florence rejected the request (HTTP {e.code}): {detail}")
+            last_error = e
+        except (OSError, http.client.HTTPException, ValueError) as e:  # URLError, timeouts, bad JSON
+            last_error = e
+        if attempt < FLORENCE_RETRIES - 1:
+            time.sleep(2)
+    raise RuntimeError(f"Florence request failed after {FLORENCE_RETRIES} attempts: {last_error}")
+
+
+def fail(error: str, error_code: str, original_file_name: str, exit_code: int = 2, florence=None):
+    """
+    Print the error object and exit. With florence (the chunk pool), queued chunks are
+    cancelled and requests still in flight are abandoned instead of awaited.
+    """
+    if florence is not None:
+        florence.shutdown(wait=False, cancel_futures=True)
+    print(json.dumps({
+        "error": error,
+        "errorCode": error_code,
+        "originalFileName": original_file_name
+    }), flush=True)
+    if florence is not None:
+        os._exit(exit_code)  # sys.exit would join the pool threads blocked on Florence
+    sys.exit(exit_code)
+
+
+# ── Main extractor ─────────────────────────────────────────────────────────────
+
+def extract(file_path: str, original_file_name: str) -> dict:
+    fp = Path(file_path)
+
+    # Derive filePrefix from the temp filename (strip "input.pdf" suffix)
+    file_prefix = fp.name
+    match = re.match(r'^(.+?)input\.[^.]+$', fp.name)
+    if match:
+        file_prefix = match.group(1)
+
+    # Text layer + image coverage for every page. Pages that need vision are sent
+    # to Florence in chunks as soon as a chunk fills, while the scan continues.
+    text_pages = []
+    vision_numbers = []
+    chunks = []     # (page numbers, future)
+    chunk = []
+    with ThreadPoolExecutor(max_workers=VISION_INFLIGHT) as florence:
+        try:
+            with pdfplumber.open(str(fp)) as pdf:
+                for number, page in enumerate(pdf.pages, start=1):
+                    text = page.extract_text() or ""
+                    coverage = image_coverage(page)
+                    text_pages.append((text, coverage))
+                    page.flush_cache()
+                    if needs_vision(text, coverage):
+                        vision_numbers.append(number)
+                        chunk.append(number)
+                        if len(chunk) == VISION_CHUNK_PAGES:
+                            chunks.append((chunk, florence.submit(florence_analyze, str(fp), chunk)))
+                            chunk = []
+        except Exception as e:
+            err_msg = str(e)
+            if "encrypt" in err_msg.lower() or "password" in err_msg.lower():
+                fail("PDF file is password-protected and cannot be processed.", "PDF_ENCRYPTED", original_file_name,
+                     florence=florence)
+            fail(f"Failed to open PDF file: {err_msg}", "PDF_CORRUPT", original_file_name, florence=florence)
+        if chunk:
+            chunks.append((chunk, florence.submit(florence_analyze, str(fp), chunk)))
+
+        # Collect in page order; chunks finish in any order
+        vision_results = {}
+        try:
+            for numbers, future in chunks:
+                for number, result in zip(numbers, future.result()):
+                    vision_results[number] = result
+        except Exception as e:  # RuntimeError from florence_analyze, or anything unexpected in a chunk
+            fail(str(e) or repr(e), "FLORENCE_FAILED", original_file_name, florence=florence)
+
+    pages = []
+    for number, (layer_text, _) in enumerate(text_pages, start=1):
+        vision = vision_results.get(number)
+        if vision is None:
+            text = layer_text
+            vision_analysis = {}
+            is_diagram = False
+        else:
+            ocr_text = vision.get("ocr_text", "")
+            description = vision.get("description", "")
+            # Keep a usable text layer; fall back to OCR, then caption (as Parse OCR & Vision does)
+            text = layer_text if word_count(layer_text) >= MIN_TEXT_WORDS else (ocr_text or description)
+            vision_analysis = {"description": description}
+            is_diagram = word_count(ocr_text) < DIAGRAM_OCR_WORDS
+
+        pages.append({
+            "pageNumber":     number,
+            "text":           text,
+            "wordCount":      word_count(text),
+            "visionAnalysis": vision_analysis,
+            "isDiagram":      is_diagram,
+            "source":         "textLayer" if vision is None else "vision"
+        })
+
+    return {
+        "filePrefix":       file_prefix,
+        "originalFileName": original_file_name,
+        "totalPages":       len(pages),
+        "totalWords":       sum(p["wordCount"] for p in pages),
+        "hasDiagrams":      any(p["isDiagram"] for p in pages),
+        "fullDocument":     "\n\n".join(p["text"] for p in pages),
+        "pages":            pages,
+        "metadata": {
+            "pagesTextLayer": [p["pageNumber"] for p in pages if p["source"] == "textLayer"],
+            "pagesVision":    vision_numbers,
+            "extractor":      "pdf_extractor.py"
+        }
+    }
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({
+            "error": "Usage: pdf_extractor.py <file_path> [original_file_name]",
+            "errorCode": "MISSING_ARGS"
+        }), flush=True)
+        sys.exit(1)
+
+    file_path = sys.argv[1]
+    original_name = sys.argv[2] if len(sys.argv) > 2 else Path(file_path).name
+
+    if not os.path.exists(file_path):
+        print(json.dumps({
+            "error": f"File not found: {file_path}",
+            "errorCode": "FILE_NOT_FOUND",
+            "originalFileName": original_name
+        }), flush=True)
+        sys.exit(1)
+
+    result = extract(file_path, original_name)
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+    sys.exit(0)